@@ -2,9 +2,12 @@
 Load drug_classes.json (includes Goal 1: current_therapy_boost), dosing_config.json, glucose_targets.json from S3 or local.
 Caches in Lambda execution context. Used by lambda_handler.
 """
+import functools
 import json
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 from botocore.exceptions import ClientError
 
 try:
@@ -13,16 +16,29 @@ try:
 except ImportError:
     boto3 = None
     Config = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # S3 client timeouts so we fail fast instead of hanging until Lambda timeout
 S3_CONFIG = Config(connect_timeout=5, read_timeout=10, retries={"max_attempts": 1}) if Config else None
 CONFIG_LOADER_VERSION = "2026-01-30-flush"  # log this to confirm deployed code
 
 _drug_classes_raw_cache = None
-_drug_config_cache = None
+_drug_config_cache = None  # normalized {classes, drugs} (+ costs applied); derived from _drug_classes_raw_cache
 _goal1_cache = None
 _goal2_cache = None
 _goal3_cache = None
+_S3_CLIENT = None
+
+
+def _s3_client():
+    """Shared S3 client (clients are thread-safe once built; boto3.client() itself is not, so build it once)."""
+    global _S3_CLIENT
+    if _S3_CLIENT is None:
+        _S3_CLIENT = boto3.client("s3", config=S3_CONFIG)
+    return _S3_CLIENT
 
 
 def _log(msg):
@@ -30,19 +46,27 @@ def _log(msg):
     print(msg)
     sys.stdout.flush()
 
+
+def _loads_bytes(raw):
+    """Parse JSON straight from S3 body bytes (no intermediate decode to str). orjson if available, else stdlib."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
 def load_drug_classes_from_s3(bucket_name, object_key):
     """Load drug_classes JSON from S3. Returns full data (drug_classes + goal1 keys)."""
     if boto3 is None:
         raise RuntimeError("boto3 required for S3 load")
     try:
         _log(f"S3 get_object starting: s3://{bucket_name}/{object_key}")
-        s3_client = boto3.client("s3", config=S3_CONFIG)
-        _log("S3 client created, calling get_object...")
+        s3_client = _s3_client()
+        _log("S3 client ready, calling get_object...")
         response = s3_client.get_object(Bucket=bucket_name, Key=object_key)
         _log("S3 get_object returned, reading body...")
         raw = response["Body"].read()
         _log(f"S3 body read ({len(raw)} bytes), parsing JSON...")
-        data = json.loads(raw.decode("utf-8"))
+        data = _loads_bytes(raw)
         _log("drug_classes S3 load complete")
         return data
     except ClientError as e:
@@ -53,6 +77,7 @@ def load_drug_classes_from_s3(bucket_name, object_key):
         raise
 
 
+@functools.lru_cache(maxsize=1)
 def _drug_classes_local_path():
     """Return path to drug_classes.json if it exists in package, else None."""
     base = os.path.dirname(os.path.abspath(__file__))
@@ -72,16 +97,25 @@ def load_drug_classes_from_local():
         return json.load(f)
 
 
-def _load_json_local(filename):
-    """Load a JSON file from same dir as this module or /var/task. Returns None if not found."""
+@functools.lru_cache(maxsize=32)
+def _resolve_local_path(filename):
+    """Return first existing path for filename (module dir, /var/task, cwd), else None. Cached: package layout is fixed per container."""
     base = os.path.dirname(os.path.abspath(__file__))
     for path in [os.path.join(base, filename), os.path.join("/var/task", filename), filename]:
         if os.path.exists(path):
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
+            return path
     return None
 
 
+def _load_json_local(filename):
+    """Load a JSON file from same dir as this module or /var/task. Returns None if not found."""
+    path = _resolve_local_path(filename)
+    if path is None:
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
 def load_goal1():
     """Load Goal 1 data (current_therapy_boost) from drug_classes.json. Cached."""
     global _goal1_cache
@@ -101,9 +135,9 @@ def _load_json_from_s3(bucket_name, object_key):
     if not bucket_name or not object_key or boto3 is None:
         return None
     try:
-        s3_client = boto3.client("s3", config=S3_CONFIG)
+        s3_client = _s3_client()
         response = s3_client.get_object(Bucket=bucket_name, Key=object_key)
-        return json.loads(response["Body"].read().decode("utf-8"))
+        return _loads_bytes(response["Body"].read())
     except Exception as e:
         print(f"Failed to load s3://{bucket_name}/{object_key}: {e}")
         return None
@@ -196,6 +230,28 @@ def load_drug_classes(s3_bucket=None, s3_key=None):
     return _drug_config_cache
 
 
+def prewarm_configs():
+    """Populate drug_classes, goal2 and goal3 caches concurrently (each may be an S3 round-trip).
+    Called at module import in lambda_function so the fetches run during Lambda init, not request time.
+    Failures are logged only; the handler retries the normal sequential load on first request."""
+    if boto3 is not None and os.environ.get("DRUG_CLASSES_S3_BUCKET"):
+        try:
+            _s3_client()  # create on this thread before the workers share it
+        except Exception as e:
+            _log(f"Config prewarm: S3 client failed ({type(e).__name__}: {e})")
+            return
+    with ThreadPoolExecutor(max_workers=3) as ex:
+        futures = {
+            "drug_classes": ex.submit(load_drug_classes),
+            "goal2": ex.submit(load_goal2),
+            "goal3": ex.submit(load_goal3),
+        }
+    for name, fut in futures.items():
+        exc = fut.exception()
+        if exc is not None:
+            _log(f"Config prewarm: {name} failed ({type(exc).__name__}: {exc})")
+
+
 def _apply_drug_costs(config, by_class):
     """Override cost/tier in config from drug_costs.json by_class. Used for cheapest-in-class and coverage scoring."""
     if not by_class or not isinstance(by_class, dict):
@@ -245,13 +301,15 @@ def _normalize_drug_config(raw):
     if raw.get("classes") and raw.get("drugs"):
         classes = raw["classes"]
         drugs_out = {}
+        no_class_data = {}  # shared read-only default for drugs whose class has no entry
         for drug_id, data in raw["drugs"].items():
             cls_name = data.get("class", drug_id)
-            class_data = classes.get(cls_name, {})
+            class_data = classes.get(cls_name, no_class_data)
             # Merge class (insurance + allergy) into drug. Union class + drug allergy_labels (hybrid: class-level and drug-level).
             class_allergy = class_data.get("allergy_labels") or []
             drug_allergy = data.get("allergy_labels") or []
-            merged_allergy = list(dict.fromkeys(class_allergy + drug_allergy))  # order preserved, deduped
+            seen = set()
+            merged_allergy = [x for x in chain(class_allergy, drug_allergy) if not (x in seen or seen.add(x))]  # order preserved, deduped
             merged = {
                 "cost": class_data.get("cost"),
                 "tier": class_data.get("tier"),
@@ -15,7 +15,7 @@ try:
     import boto3
 except ImportError:
     boto3 = None
-from config_loader import load_drug_classes, load_goal1, load_goal2, load_goal3, CONFIG_LOADER_VERSION
+from config_loader import load_drug_classes, load_goal1, load_goal2, load_goal3, prewarm_configs, CONFIG_LOADER_VERSION
 from transform import _normalize_request, transform_request_to_patient, normalize_glucose_readings
 from scoring import calculate_scores, get_all_drug_weight_details
 from dosing import get_recommended_dose
@@ -34,6 +34,10 @@ from deescalation import should_recommend_deescalation, get_deescalation_recomme
 from rule_interpreter import evaluate_structured_rule
 from scoring import _rule_context
 
+# Fetch drug_classes/goal2/goal3 in parallel during Lambda init. Set DISABLE_CONFIG_PREWARM=1 (e.g. unit tests) to skip.
+if os.environ.get("DISABLE_CONFIG_PREWARM") != "1":
+    prewarm_configs()
+
 # Single source for API response display names. Used for top3BestOptions and allDrugWeights so #1, #2, and lowest cost all match.
 RESPONSE_DISPLAY_NAMES = {
     "Bexagliflozin": "Bexagliflozin (Brenzavy)",
@@ -3,26 +3,62 @@ Structured JSON rule interpreter (Option 1).
 Evaluates rules like {"field": "eGFR", "op": "lt", "value": 30}
 or {"and": [...]} / {"or": [...]} against a context dict.
 No eval(); fixed set of fields and operators.
+Rules are compiled once (compile_rule) into tuple trees with integer opcodes.
 """
+import operator
 
 # Allowed fields (context keys or special names)
-NUMERIC_FIELDS = {"eGFR", "a1c", "age", "goal", "fasting_above_goal", "post_prandial_above_goal", "fasting_avg", "lows_detected"}
-SET_FIELDS = {"comorbidity", "comorbidities", "allergy", "allergy_labels"}
+NUMERIC_FIELDS = frozenset({"eGFR", "a1c", "age", "goal", "fasting_above_goal", "post_prandial_above_goal", "fasting_avg", "lows_detected"})
+COMORBIDITY_FIELDS = frozenset({"comorbidity", "comorbidities"})
+ALLERGY_FIELDS = frozenset({"allergy", "allergy_labels"})
+SET_FIELDS = COMORBIDITY_FIELDS | ALLERGY_FIELDS
+# Glucose-derived numeric fields: missing value means no glucose data, so the rule does not apply
+_GLUCOSE_FIELDS = frozenset({"fasting_above_goal", "post_prandial_above_goal", "fasting_avg"})
 
 # Allowed ops for numeric comparisons
-NUMERIC_OPS = {"lt", "le", "gt", "ge", "eq", "ne"}
+NUMERIC_OPS = frozenset({"lt", "le", "gt", "ge", "eq", "ne"})
 
 # Ops for set membership
-SET_OPS = {"in", "not_in"}
+SET_OPS = frozenset({"in", "not_in"})
+
+
+def _normalized_set(s, norm):
+    """Set of norm(str(x).strip()) for an iterable (a scalar counts as one element); empty set for None."""
+    if s is None:
+        return set()
+    if isinstance(s, (list, tuple, set, frozenset)):
+        try:
+            # Common case: all strings; map() keeps the per-element work in C (no str() call / generator frame)
+            return set(map(norm, map(str.strip, s)))
+        except TypeError:
+            return set(norm(str(x).strip()) for x in s)
+    if hasattr(s, "__iter__") and not isinstance(s, str):
+        return set(norm(str(x).strip()) for x in s)
+    return {norm(str(s).strip())}
+
+
+def _comorbidity_set(context):
+    return _normalized_set(context.get("comorbidities") or context.get("comorbidity"), str.upper)
+
+
+def _allergy_set(context):
+    return _normalized_set(context.get("allergy_labels_set") or context.get("allergy_labels") or context.get("allergies"), str.lower)
+
+
+def prepare_context(ctx):
+    """Attach the normalized comorbidity / allergy sets to ctx once so every rule reuses them. Returns ctx."""
+    ctx["_comorbidity_set_upper"] = _comorbidity_set(ctx)
+    ctx["_allergy_set_lower"] = _allergy_set(ctx)
+    return ctx
 
 
 def _get_value(context, field):
     """Resolve field to a value from context."""
-    if field in ("eGFR", "a1c", "age", "goal", "fasting_above_goal", "post_prandial_above_goal", "fasting_avg", "lows_detected"):
+    if field in NUMERIC_FIELDS:
         v = context.get(field)
         if v is None and field == "goal":
             return 7.0
-        if v is None and field in ("fasting_above_goal", "post_prandial_above_goal", "fasting_avg"):
+        if v is None and field in _GLUCOSE_FIELDS:
             return None  # no glucose data: rule does not apply (no penalty)
         if v is None and field == "lows_detected":
             return 0.0
@@ -30,122 +66,145 @@ def _get_value(context, field):
             return float(v) if v is not None else 0.0
         except (TypeError, ValueError):
             return 0.0
-    if field in ("comorbidity", "comorbidities"):
-        s = context.get("comorbidities") or context.get("comorbidity")
-        return set() if s is None else set(str(x).strip().upper() for x in s) if hasattr(s, "__iter__") and not isinstance(s, str) else {str(s).strip().upper()}
-    if field in ("allergy", "allergy_labels"):
-        s = context.get("allergy_labels_set") or context.get("allergy_labels") or context.get("allergies")
-        if s is None:
-            return set()
-        if hasattr(s, "__iter__") and not isinstance(s, str):
-            return set(str(x).strip().lower() for x in s)
-        return {str(s).strip().lower()}
+    if field in COMORBIDITY_FIELDS:
+        s = context.get("_comorbidity_set_upper")
+        return s if s is not None else _comorbidity_set(context)
+    if field in ALLERGY_FIELDS:
+        s = context.get("_allergy_set_lower")
+        return s if s is not None else _allergy_set(context)
     return None
 
 
-def _apply_numeric(op, left, right):
-    """Compare two numbers. right can be int or float."""
-    try:
-        r = float(right) if not isinstance(right, (int, float)) else right
-    except (TypeError, ValueError):
-        return False
-    if op == "lt":
-        return left < r
-    if op == "le":
-        return left <= r
-    if op == "gt":
-        return left > r
-    if op == "ge":
-        return left >= r
-    if op == "eq":
-        return abs(left - r) < 1e-9
-    if op == "ne":
-        return abs(left - r) >= 1e-9
-    return False
+# Compiled rule nodes are tuples tagged with an integer kind; numeric ops index _NUMERIC_DISPATCH.
+OP_LT, OP_LE, OP_GT, OP_GE, OP_EQ, OP_NE = range(6)
+_NUMERIC_OPCODES = {"lt": OP_LT, "le": OP_LE, "gt": OP_GT, "ge": OP_GE, "eq": OP_EQ, "ne": OP_NE}
+_NUMERIC_DISPATCH = [
+    operator.lt,
+    operator.le,
+    operator.gt,
+    operator.ge,
+    lambda a, b: abs(a - b) < 1e-9,
+    lambda a, b: abs(a - b) >= 1e-9,
+]
 
+# Node kinds: (K_FALSE,) | (K_AND, children) | (K_OR, children) | (K_NUM, field, opcode, value)
+# | (K_SET, field, negate, check_set) for comorbidities | (K_ALLERGY, field, negate, check_set)
+K_FALSE, K_AND, K_OR, K_NUM, K_SET, K_ALLERGY = range(6)
+_FALSE_NODE = (K_FALSE,)
 
-def _apply_set(op, context_val, rule_value):
-    """Set membership. rule_value can be string or list."""
-    if context_val is None:
-        context_val = set()
-    if not isinstance(context_val, set):
-        context_val = {str(context_val).strip()}
-    if isinstance(rule_value, list):
-        check_set = set(str(x).strip().upper() for x in rule_value)
-    else:
-        check_set = {str(rule_value).strip().upper()}
-    # For comorbidities we compare uppercase
-    if op == "in":
-        return bool(check_set & context_val) if context_val else False
-    if op == "not_in":
-        return not (check_set & context_val) if context_val else True
-    return False
+# id(rule) -> (rule, compiled). Rule dicts come from the cached configs, so the same objects recur across
+# invocations; the rule is held so its id cannot be reused while cached. Cleared if configs churn.
+_COMPILED_CACHE = {}
+_COMPILED_CACHE_MAX = 4096
 
 
-def _apply_allergy_in(context_val, rule_value):
-    """Check if context allergy set intersects rule value (string or list). Case-insensitive."""
-    if context_val is None:
-        context_val = set()
-    if not isinstance(context_val, set):
-        context_val = {str(context_val).strip().lower()}
+def _check_set(rule_value, norm):
+    """Normalize rule value (string or list) to a frozenset for membership tests."""
     if isinstance(rule_value, list):
-        check_set = set(str(x).strip().lower() for x in rule_value)
-    else:
-        check_set = {str(rule_value).strip().lower()}
-    return bool(check_set & context_val)
+        return frozenset(norm(str(x).strip()) for x in rule_value)
+    return frozenset((norm(str(rule_value).strip()),))
 
 
-def evaluate_structured_rule(rule, context):
-    """
-    Evaluate a single structured rule against context.
-    rule: dict e.g. {"field": "eGFR", "op": "lt", "value": 30}
-          or {"and": [rule1, rule2]} / {"or": [rule1, rule2]}
-    context: dict with eGFR, a1c, age, goal, comorbidities (set), allergy_labels_set (set)
-    Returns bool.
-    """
-    if rule is None:
-        return False
-    if not isinstance(rule, dict):
-        return False
+def _cost(node):
+    """Rough evaluation cost of a compiled node: constant < numeric compare < set intersection < nested and/or."""
+    kind = node[0]
+    if kind == K_FALSE:
+        return 0
+    if kind == K_NUM:
+        return 1
+    if kind == K_SET or kind == K_ALLERGY:
+        return 3
+    return 5 + len(node[1])
+
 
-    if "and" in rule:
-        sub = rule["and"]
-        if not isinstance(sub, list):
-            return False
-        return all(evaluate_structured_rule(r, context) for r in sub)
+def _compile(rule):
+    if not isinstance(rule, dict):
+        return _FALSE_NODE
 
-    if "or" in rule:
-        sub = rule["or"]
-        if not isinstance(sub, list):
-            return False
-        return any(evaluate_structured_rule(r, context) for r in sub)
+    for key, kind in (("and", K_AND), ("or", K_OR)):
+        if key in rule:
+            sub = rule[key]
+            if not isinstance(sub, list):
+                return _FALSE_NODE
+            # Predicates are side-effect free, so cheapest-first ordering only changes how soon and/or short-circuit
+            return (kind, tuple(sorted((_compile(r) for r in sub), key=_cost)))
 
     field = rule.get("field")
     op = rule.get("op")
     value = rule.get("value")
     if field is None or op is None:
-        return False
+        return _FALSE_NODE
 
     if field in NUMERIC_FIELDS:
-        left = _get_value(context, field)
-        if left is None:
-            return False  # e.g. no glucose data: fasting_above_goal/post_prandial_above_goal rule does not apply
-        if op not in NUMERIC_OPS:
-            return False
-        return _apply_numeric(op, left, value)
+        opcode = _NUMERIC_OPCODES.get(op)
+        if opcode is None:
+            return _FALSE_NODE
+        try:
+            r = float(value) if not isinstance(value, (int, float)) else value
+        except (TypeError, ValueError):
+            return _FALSE_NODE
+        return (K_NUM, field, opcode, r)
 
-    if field in ("comorbidity", "comorbidities"):
-        context_val = _get_value(context, field)
+    if field in COMORBIDITY_FIELDS:
         if op not in SET_OPS:
-            return False
-        return _apply_set(op, context_val, value)
-
-    if field in ("allergy", "allergy_labels"):
-        context_val = _get_value(context, field)
-        if op == "in":
-            return _apply_allergy_in(context_val, value)
-        if op == "not_in":
-            return not _apply_allergy_in(context_val, value)
-        return False
+            return _FALSE_NODE
+        # For comorbidities we compare uppercase
+        return (K_SET, field, op == "not_in", _check_set(value, str.upper))
+
+    if field in ALLERGY_FIELDS:
+        if op not in SET_OPS:
+            return _FALSE_NODE
+        return (K_ALLERGY, field, op == "not_in", _check_set(value, str.lower))
+
+    return _FALSE_NODE
 
+
+def compile_rule(rule):
+    """
+    Compile a structured rule dict into a tuple tree (cached per rule object).
+    Validation, operator lookup and rule-value normalization happen here once instead of on every evaluation.
+    """
+    hit = _COMPILED_CACHE.get(id(rule))
+    if hit is not None and hit[0] is rule:
+        return hit[1]
+    compiled = _compile(rule)
+    if len(_COMPILED_CACHE) >= _COMPILED_CACHE_MAX:
+        _COMPILED_CACHE.clear()
+    _COMPILED_CACHE[id(rule)] = (rule, compiled)
+    return compiled
+
+
+def _evaluate(node, context):
+    kind = node[0]
+    if kind == K_NUM:
+        left = _get_value(context, node[1])
+        if left is None:
+            return False  # e.g. no glucose data: fasting_above_goal/post_prandial_above_goal rule does not apply
+        return _NUMERIC_DISPATCH[node[2]](left, node[3])
+    if kind == K_AND:
+        for child in node[1]:
+            if not _evaluate(child, context):
+                return False
+        return True
+    if kind == K_OR:
+        for child in node[1]:
+            if _evaluate(child, context):
+                return True
+        return False
+    if kind == K_SET or kind == K_ALLERGY:
+        hit = not node[3].isdisjoint(_get_value(context, node[1]))
+        return hit != node[2]
     return False
+
+
+def evaluate_structured_rule(rule, context):
+    """
+    Evaluate a single structured rule against context.
+    rule: dict e.g. {"field": "eGFR", "op": "lt", "value": 30}
+          or {"and": [rule1, rule2]} / {"or": [rule1, rule2]}
+    context: dict with eGFR, a1c, age, goal, comorbidities (set), allergy_labels_set (set)
+    Returns bool.
+    """
+    if rule is None:
+        return False
+    return _evaluate(compile_rule(rule), context)
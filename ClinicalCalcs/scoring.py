@@ -5,7 +5,7 @@ Uses rule_interpreter for structured rules; glucose for Goal 3; goal1/goal3 JSON
 # Generic denied_reason when a drug is excluded due to patient allergy (class or drug-level).
 ALLERGY_DENIED_REASON = "Allergy to this drug/class"
 
-from rule_interpreter import evaluate_structured_rule
+from rule_interpreter import evaluate_structured_rule, prepare_context
 from dosing import calculate_next_dose
 from glucose import (
     calculate_goal3_boost,
@@ -55,7 +55,7 @@ def _rule_context(patient, normalized_glucose=None, goal3_data=None):
                 cm = {str(comorbidities).strip().upper()} if comorbidities else set()
             lows = bool({"FREQUENT HYPOGLYCEMIA", "HISTORY OF HYPOGLYCEMIA"} & cm)
         ctx["lows_detected"] = 1 if lows else 0
-    return ctx
+    return prepare_context(ctx)
 
 
 HIGH_HYPO_RISK_CLASSES = frozenset({"Sulfonylurea", "Basal Insulin", "Bolus Insulin"})
@@ -3,6 +3,45 @@ Transform raw API request to patient dict and normalize glucose readings.
 Uses drug_classes for allergy mapping; goal2_data for form_value -> class mapping and drug name -> drug_id.
 """
 import re
+import sys
+from statistics import fmean
+
+# Brand in parens, e.g. "Empagliflozin (Jardiance)" -> "Jardiance"; leading number of an A1C goal, e.g. "<7.5%" -> "7.5"
+_PAREN_RE = re.compile(r"\(([^)]+)\)")
+_A1C_NUM_RE = re.compile(r"([\d.]+)")
+
+# Lookup tables derived from the config blobs, keyed by the identity of those (module-cached) objects so
+# warm invocations reuse them. Sources are held in the entry so their ids cannot be reused while cached.
+_DERIVED_CACHE = {}
+_DERIVED_CACHE_MAX = 8
+
+
+def _derived(builder, *sources):
+    """builder(*sources), memoized per (builder, source objects)."""
+    key = (builder,) + tuple(map(id, sources))
+    hit = _DERIVED_CACHE.get(key)
+    if hit is not None and all(a is b for a, b in zip(hit[0], sources)):
+        return hit[1]
+    value = builder(*sources)
+    if len(_DERIVED_CACHE) >= _DERIVED_CACHE_MAX:
+        _DERIVED_CACHE.clear()
+    _DERIVED_CACHE[key] = (sources, value)
+    return value
+
+
+def _register_med_str(name_to_drug_id, med_str, drug_id):
+    """Map a goal2 medication string (key as given), its first word (e.g. "Empagliflozin") and brand in parens
+    (e.g. "Jardiance") to drug_id."""
+    if not med_str:
+        return
+    name_to_drug_id[med_str] = drug_id
+    parts = med_str.split()
+    if parts:
+        name_to_drug_id[parts[0]] = drug_id
+    if "(" in med_str:
+        paren = _PAREN_RE.search(med_str)
+        if paren:
+            name_to_drug_id[paren.group(1).strip()] = drug_id
 
 
 def build_drug_name_to_id(goal2_data, config):
@@ -33,18 +72,7 @@ def build_drug_name_to_id(goal2_data, config):
         for drug_id, drug_cfg in by_drug.items():
             if drug_id not in drugs:
                 continue
-            med_str = (drug_cfg or {}).get("medication") or ""
-            if med_str:
-                name_to_drug_id[med_str.strip()] = drug_id
-                # first word (e.g. "Empagliflozin")
-                first = med_str.split()[0] if med_str.split() else ""
-                if first:
-                    name_to_drug_id[first] = drug_id
-                # brand in parens (e.g. "Jardiance")
-                import re as _re
-                paren = _re.search(r"\(([^)]+)\)", med_str)
-                if paren:
-                    name_to_drug_id[paren.group(1).strip()] = drug_id
+            _register_med_str(name_to_drug_id, ((drug_cfg or {}).get("medication") or "").strip(), drug_id)
             name_to_drug_id[drug_id] = drug_id
     # From drug_classes: display_name (e.g. "Semaglutide (Ozempic)", "Empagliflozin (Jardiance)") -> drug_id
     # so frontend-sent names match and Semaglutide vs Semaglutide Oral resolve by full name or brand.
@@ -55,7 +83,7 @@ def build_drug_name_to_id(goal2_data, config):
         display = (data.get("display_name") or "").strip()
         if display:
             name_to_drug_id[display] = did
-            paren = re.search(r"\(([^)]+)\)", display)
+            paren = _PAREN_RE.search(display)
             if paren:
                 name_to_drug_id[paren.group(1).strip()] = did
     # Default medication -> drug_id for classes without by_drug (Metformin, TZD, Basal, Bolus)
@@ -70,20 +98,19 @@ def build_drug_name_to_id(goal2_data, config):
         if len(candidates) == 1:
             drug_id = candidates[0]
             class_to_default_drug_id[class_name] = drug_id
-            if med_str:
-                name_to_drug_id[med_str] = drug_id
-                first = med_str.split()[0] if med_str.split() else ""
-                if first:
-                    name_to_drug_id[first] = drug_id
-                paren = re.search(r"\(([^)]+)\)", med_str)
-                if paren:
-                    name_to_drug_id[paren.group(1).strip()] = drug_id
+            _register_med_str(name_to_drug_id, med_str, drug_id)
         else:
             # Multiple drugs (e.g. SGLT2): default medication already in name_to_drug_id from by_drug
             class_to_default_drug_id[class_name] = name_to_drug_id.get(med_str, candidates[0] if candidates else None)
     return name_to_drug_id, class_to_default_drug_id
 
 
+def _build_name_to_drug_id_lc(goal2_data, config):
+    """Lowercased name_to_drug_id for case-insensitive lookups."""
+    name_to_drug_id, _ = _derived(build_drug_name_to_id, goal2_data, config)
+    return {k.lower(): v for k, v in name_to_drug_id.items()}
+
+
 def form_value_to_class_mapping(goal2_data):
     """Build form_value -> class name from goal2 form_value_by_class. Returns None if invalid."""
     if not goal2_data or not isinstance(goal2_data.get("form_value_by_class"), dict):
@@ -91,6 +118,20 @@ def form_value_to_class_mapping(goal2_data):
     return {v: k for k, v in goal2_data["form_value_by_class"].items()}
 
 
+def _build_allergy_tables(drug_classes):
+    """(allergy label -> frozenset of drug_ids from each drug's allergy_labels, drug_id -> class)."""
+    drugs = drug_classes.get("drugs", {}) if isinstance(drug_classes, dict) else {}
+    label_to_drug_ids = {}
+    drug_id_to_class = {}
+    for drug_id, cfg in drugs.items():
+        if isinstance(cfg, dict):
+            drug_id_to_class[drug_id] = cfg.get("class")
+            for label in cfg.get("allergy_labels", []):
+                label_to_drug_ids.setdefault(label, set()).add(drug_id)
+    # Shared by every request through the _derived cache: freeze the id sets so no caller can mutate them
+    return {label: frozenset(ids) for label, ids in label_to_drug_ids.items()}, drug_id_to_class
+
+
 COMORBIDITY_MAPPING = {
     "Heart Failure (CHF)": "Heart Failure (CHF)",
     "ASCVD": "ASCVD",
@@ -115,27 +156,55 @@ COMORBIDITY_MAPPING = {
     "Other": None,
 }
 
+# COMORBIDITY_MAPPING with every value as a frozenset (None -> empty), so the loop is a single update().
+# Keys and labels are interned: patients share one string object per label.
+_COMORBIDITY_SETS = {
+    sys.intern(k): frozenset(map(sys.intern, v)) if isinstance(v, list) else frozenset() if v is None else frozenset((sys.intern(v),))
+    for k, v in COMORBIDITY_MAPPING.items()
+}
+
+
+# Frontend insurance_tier -> patient["insurance"]; unknown/missing tier defaults to Private
+_INSURANCE_BY_TIER = {"uninsured": "No Insurance", "medicaid_medicare": "Medicaid", "private": "Private"}
+
+# snake_case -> camelCase request keys; camelCase (what the frontend sends) wins when both are present
+_KEY_PAIRS = (
+    ("patient_info", "patientInfo"),
+    ("current_medications", "currentMedications"),
+    ("glucose_readings", "glucoseReadings"),
+    ("additional_context", "additionalContext"),
+    ("preferred_drug_by_class", "preferredDrugByClass"),
+    ("allergies_raw", "allergies"),
+)
+_SNAKE_KEYS = frozenset(snake for snake, _ in _KEY_PAIRS)
+
 
 def _normalize_request(request_data):
-    """Normalize request: frontend sends patientInfo, currentMedications, etc. (snake_case in patientInfo)."""
+    """Normalize request: frontend sends patientInfo, currentMedications, etc. (snake_case in patientInfo).
+    Returns request_data itself when nothing needs renaming (already camelCase), else a copy with the camelCase keys added."""
     if not request_data or not isinstance(request_data, dict):
         return request_data or {}
-    out = dict(request_data)
-    if "patient_info" in out and "patientInfo" not in out:
-        out["patientInfo"] = out["patient_info"]
-    if "current_medications" in out and "currentMedications" not in out:
-        out["currentMedications"] = out["current_medications"]
-    if "glucose_readings" in out and "glucoseReadings" not in out:
-        out["glucoseReadings"] = out["glucose_readings"]
-    if "additional_context" in out and "additionalContext" not in out:
-        out["additionalContext"] = out["additional_context"]
-    if "preferred_drug_by_class" in out and "preferredDrugByClass" not in out:
-        out["preferredDrugByClass"] = out["preferred_drug_by_class"]
-    if "allergies_raw" in out and "allergies" not in out:
-        out["allergies"] = out.get("allergies_raw", [])
+    present = request_data.keys() & _SNAKE_KEYS
+    if not present:
+        return request_data
+    out = request_data
+    for snake, camel in _KEY_PAIRS:
+        if snake in present and camel not in out:
+            if out is request_data:
+                out = dict(request_data)
+            out[camel] = out[snake]
     return out
 
 
+def _parse_a1c_goal(a1c_goal_str):
+    """A1C goal string -> float: plain "7" / "7.5%" directly, else the first number in it (e.g. "<7.5%"), else 7.5."""
+    head = a1c_goal_str.rstrip("%").strip()
+    if head.replace(".", "", 1).isdecimal():
+        return float(head)
+    goal_match = _A1C_NUM_RE.search(a1c_goal_str)
+    return float(goal_match.group(1)) if goal_match else 7.5
+
+
 def transform_request_to_patient(request_data, drug_classes=None, goal2_data=None):
     """
     Transform request to patient dict used by calculations.
@@ -147,11 +216,7 @@ def transform_request_to_patient(request_data, drug_classes=None, goal2_data=Non
     patient_info = request_data.get("patientInfo", {})
 
     a1c_goal_str = patient_info.get("a1cGoal", "")
-    if a1c_goal_str:
-        goal_match = re.search(r"([\d.]+)", a1c_goal_str)
-        patient["goal"] = float(goal_match.group(1)) if goal_match else 7.5
-    else:
-        patient["goal"] = 7.5
+    patient["goal"] = _parse_a1c_goal(a1c_goal_str) if a1c_goal_str else 7.5
 
     patient["age"] = patient_info.get("age") or 0
     patient["eGFR"] = patient_info.get("eGFR") or 0.0
@@ -160,14 +225,7 @@ def transform_request_to_patient(request_data, drug_classes=None, goal2_data=Non
 
     # insurance_tier: uninsured | medicaid_medicare | private (from frontend)
     tier = (patient_info.get("insurance_tier") or "").strip().lower()
-    if tier == "uninsured":
-        patient["insurance"] = "No Insurance"
-    elif tier == "medicaid_medicare":
-        patient["insurance"] = "Medicaid"
-    elif tier == "private":
-        patient["insurance"] = "Private"
-    else:
-        patient["insurance"] = "Private"
+    patient["insurance"] = _INSURANCE_BY_TIER.get(tier, "Private")
 
     # can_afford_copay: only when uninsured; used by handler for affordability gate
     copay = patient_info.get("can_afford_copay")
@@ -176,9 +234,10 @@ def transform_request_to_patient(request_data, drug_classes=None, goal2_data=Non
     monitor = (patient_info.get("monitoringMethod") or "").lower()
     patient["monitor"] = "CGM" if "cgm" in monitor else "fingerstick"
 
-    mapping = form_value_to_class_mapping(goal2_data) if goal2_data else None
+    mapping = _derived(form_value_to_class_mapping, goal2_data) if goal2_data else None
     # No fallback: use only goal2 form_value_by_class to map form class to internal class
-    name_to_drug_id, class_to_default_drug_id = build_drug_name_to_id(goal2_data, drug_classes)
+    name_to_drug_id, class_to_default_drug_id = _derived(build_drug_name_to_id, goal2_data, drug_classes)
+    name_to_drug_id_lc = _derived(_build_name_to_drug_id_lc, goal2_data, drug_classes)
     current_meds = request_data.get("currentMedications", [])
     patient["current_classes"] = []
     patient["current_drugs"] = {}
@@ -186,54 +245,56 @@ def transform_request_to_patient(request_data, drug_classes=None, goal2_data=Non
     current_drug_ids_set = set()
 
     for med in current_meds:
-        form_class = med.get("drugClass", "").lower()
-        if not mapping:
+        # Unknown/unmapped form class: nothing below applies
+        drug_class = mapping.get((med.get("drugClass") or "").lower()) if mapping else None
+        if not drug_class:
             continue
-        drug_class = mapping.get(form_class)
-        if drug_class:
-            patient["current_classes"].append(drug_class)
-            drug_name = (med.get("drugName") or "").strip()
-            dose = med.get("dose", "")
-            frequency = med.get("frequency", "")
-            if drug_name:
-                patient["current_drugs"][drug_class] = f"{drug_name} {dose} {frequency}"
-            # Resolve to config drug_id only when the drug name maps to a drug in config.
-            # No fallback to class default: if the medication isn't in config, we don't add a drug_id
-            # (avoids e.g. mapping Empagliflozin -> Dapagliflozin when Empagliflozin is missing).
-            drug_id = None
-            if drug_name:
-                drug_id = name_to_drug_id.get(drug_name) or name_to_drug_id.get(drug_name.split()[0] if drug_name else "")
-                if not drug_id and "(" in drug_name:
-                    brand = re.search(r"\(([^)]+)\)", drug_name)
-                    if brand:
-                        drug_id = name_to_drug_id.get(brand.group(1).strip())
-            if drug_id:
-                current_drug_ids_set.add(drug_id)
-                info = {
-                    "drugName": drug_name or "",
-                    "dose": dose,
-                    "frequency": frequency,
-                }
-                # Frontend sends isHighestTolerableDose only for biguanides and GLP-1/GIP
-                if med.get("isHighestTolerableDose") is not None:
-                    info["is_highest_tolerable_dose"] = bool(med.get("isHighestTolerableDose"))
-                patient["current_medication_info"][drug_id] = info
+        patient["current_classes"].append(drug_class)
+        drug_name = (med.get("drugName") or "").strip()
+        dose = med.get("dose", "")
+        frequency = med.get("frequency", "")
+        if drug_name:
+            patient["current_drugs"][drug_class] = f"{drug_name} {dose} {frequency}"
+        # Resolve to config drug_id only when the drug name maps to a drug in config.
+        # No fallback to class default: if the medication isn't in config, we don't add a drug_id
+        # (avoids e.g. mapping Empagliflozin -> Dapagliflozin when Empagliflozin is missing).
+        drug_id = None
+        if drug_name:
+            # Most specific key first: full name, then brand, then first word; each exact case, then
+            # case-insensitive (frontend casing varies: "jardiance" vs "Jardiance"). The first word is last
+            # because it is shared across drugs ("Semaglutide" covers Ozempic and Rybelsus).
+            first = drug_name.split()[0]
+            brand_m = _PAREN_RE.search(drug_name) if "(" in drug_name else None
+            brand = brand_m.group(1).strip() if brand_m else None
+            drug_id = (
+                name_to_drug_id.get(drug_name)
+                or name_to_drug_id_lc.get(drug_name.lower())
+                or (brand and (name_to_drug_id.get(brand) or name_to_drug_id_lc.get(brand.lower())))
+                or name_to_drug_id.get(first)
+                or name_to_drug_id_lc.get(first.lower())
+            )
+        if drug_id:
+            current_drug_ids_set.add(drug_id)
+            info = {
+                "drugName": drug_name or "",
+                "dose": dose,
+                "frequency": frequency,
+            }
+            # Frontend sends isHighestTolerableDose only for biguanides and GLP-1/GIP
+            if med.get("isHighestTolerableDose") is not None:
+                info["is_highest_tolerable_dose"] = bool(med.get("isHighestTolerableDose"))
+            patient["current_medication_info"][drug_id] = info
     patient["current_drug_ids"] = current_drug_ids_set
 
     comorbidities = request_data.get("comorbidities", [])
     normalized_comorbidities = set()
     for com in comorbidities:
-        if com in COMORBIDITY_MAPPING:
-            mapped = COMORBIDITY_MAPPING[com]
-            if mapped is None:
-                continue
-            if isinstance(mapped, list):
-                normalized_comorbidities.update(mapped)
-            else:
-                normalized_comorbidities.add(mapped)
+        mapped = _COMORBIDITY_SETS.get(com)
+        if mapped is not None:
+            normalized_comorbidities.update(mapped)
         elif com and com.startswith("Other:"):
             # Handle "Other: custom text" format - extract and preserve custom comorbidity
-            custom_text = com.split(":", 1)[1].strip()
+            custom_text = com[6:].strip()  # len("Other:") == 6
             if custom_text:
                 normalized_comorbidities.add(custom_text.upper())
         elif com:
@@ -247,60 +308,64 @@ def transform_request_to_patient(request_data, drug_classes=None, goal2_data=Non
     # Accepts list of strings (legacy) or objects { allergen, specificDrugs?, openToTrial? }.
     # Whole class: no specificDrugs, or specificDrugs ["All"], or openToTrial is False (not open to trialing → deny entire class).
     # Granular: specificDrugs = [specific labels] and openToTrial is True → deny only those drugs; rest of class still scored.
-    drugs_for_allergy = drug_classes.get("drugs", {}) if isinstance(drug_classes, dict) else {}
-    label_to_drug_ids = {}
-    for drug_id, cfg in drugs_for_allergy.items():
-        if isinstance(cfg, dict):
-            for label in cfg.get("allergy_labels", []):
-                label_to_drug_ids.setdefault(label, set()).add(drug_id)
+    label_to_drug_ids, drug_id_to_class = _derived(_build_allergy_tables, drug_classes)
     allergy_drug_ids = set()
     allergy_labels_used = set()
     raw_allergies = request_data.get("allergies", [])
     unknown_allergies = []
     for raw in raw_allergies:
-        if isinstance(raw, dict):
-            allergen = (raw.get("allergen") or "").strip()
-            specific_drugs = raw.get("specificDrugs") or []
-            if not allergen:
-                continue
-            if allergen.startswith("Other:"):
-                custom_text = allergen.split(":", 1)[1].strip()
-                if custom_text:
-                    unknown_allergies.append(custom_text)
-                continue
-            # Not open to trialing → deny entire class; else whole-class only if no specific drugs or "All"
-            is_whole_class = (
-                raw.get("openToTrial") is False
-                or not specific_drugs
-                or (len(specific_drugs) == 1 and (specific_drugs[0] or "").strip() == "All")
-            )
-            if is_whole_class:
-                if allergen in label_to_drug_ids:
-                    allergy_drug_ids.update(label_to_drug_ids[allergen])
-                    allergy_labels_used.add(allergen)
-            else:
-                for spec in specific_drugs:
-                    spec = (spec or "").strip()
-                    if spec and spec in label_to_drug_ids:
-                        allergy_drug_ids.update(label_to_drug_ids[spec])
-                        allergy_labels_used.add(spec)
-        else:
+        if not isinstance(raw, dict):
+            # Legacy: plain label string
             s = (raw or "").strip()
-            if s and s.startswith("Other:"):
-                custom_text = s.split(":", 1)[1].strip()
+            if not s:
+                continue
+            if s.startswith("Other:"):
+                custom_text = s[6:].strip()
                 if custom_text:
                     unknown_allergies.append(custom_text)
-            elif s and s in label_to_drug_ids:
+            elif s in label_to_drug_ids:
                 allergy_drug_ids.update(label_to_drug_ids[s])
                 allergy_labels_used.add(s)
+            continue
+        allergen = (raw.get("allergen") or "").strip()
+        if not allergen:
+            continue
+        if allergen.startswith("Other:"):
+            custom_text = allergen[6:].strip()
+            if custom_text:
+                unknown_allergies.append(custom_text)
+            continue
+        specific_drugs = raw.get("specificDrugs")
+        # Not open to trialing → deny entire class; else whole-class only if no specific drugs or "All"
+        if (
+            raw.get("openToTrial") is False
+            or not specific_drugs
+            or (len(specific_drugs) == 1 and (specific_drugs[0] or "").strip() == "All")
+        ):
+            if allergen in label_to_drug_ids:
+                allergy_drug_ids.update(label_to_drug_ids[allergen])
+                allergy_labels_used.add(allergen)
+            continue
+        for spec in specific_drugs:
+            spec = (spec or "").strip()
+            if spec and spec in label_to_drug_ids:
+                allergy_drug_ids.update(label_to_drug_ids[spec])
+                allergy_labels_used.add(spec)
     patient["allergy_drug_ids"] = allergy_drug_ids
     patient["unknown_allergies"] = unknown_allergies
-    patient["allergies"] = {drugs_for_allergy.get(did, {}).get("class") for did in allergy_drug_ids if did in drugs_for_allergy}
+    patient["allergies"] = {drug_id_to_class[did] for did in allergy_drug_ids if did in drug_id_to_class}
     patient["allergies_raw"] = raw_allergies
-    patient["allergy_labels_set"] = set((lab or "").lower() for lab in allergy_labels_used if (lab or "").strip())
+    # allergy_labels_used only ever receives stripped, non-empty labels
+    patient["allergy_labels_set"] = {lab.lower() for lab in allergy_labels_used}
     return patient
 
 
+def _avg(values):
+    """Mean of the non-blank readings (numbers or numeric strings), rounded to 0.1; None if there are none."""
+    nums = [float(x) for x in values if x is not None and (not isinstance(x, str) or x.strip())]
+    return round(fmean(nums), 1) if nums else None
+
+
 def normalize_glucose_readings(request_data):
     """Normalize glucoseReadings to fasting_avg, post_pp_avg; optional cgm_*."""
     out = {"fasting_avg": None, "post_pp_avg": None}
@@ -338,11 +403,7 @@ def normalize_glucose_readings(request_data):
     out["post_pp_avg"] = post_pp.get("average")
     # If average not sent, compute from values (Goal 3 uses: post_prandial_average - potency)
     if out["fasting_avg"] is None and fasting.get("values"):
-        nums = [float(x) for x in fasting["values"] if x is not None and str(x).strip() != ""]
-        if nums:
-            out["fasting_avg"] = round(sum(nums) / len(nums), 1)
+        out["fasting_avg"] = _avg(fasting["values"])
     if out["post_pp_avg"] is None and post_pp.get("values"):
-        nums = [float(x) for x in post_pp["values"] if x is not None and str(x).strip() != ""]
-        if nums:
-            out["post_pp_avg"] = round(sum(nums) / len(nums), 1)
+        out["post_pp_avg"] = _avg(post_pp["values"])
     return out
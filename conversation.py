@@ -6,42 +6,129 @@ Conversation Lambda: follow-up Q&A about a stored recommendation.
 - Uses conversation + new question to derive intent and include only relevant recommendation
   sections in the prompt (not the full recommendation every time).
 - Calls Bedrock to generate an answer, then appends the turn to conversation in DB.
+- Long histories are compacted: older turns are folded into a Bedrock-generated summary stored on
+  the item (conversationSummary: { summary, compactedThrough }); only summary + recent turns go in the prompt.
+  The stored conversation keeps at most the last 20 turns; evicted turns survive only in the summary.
 
 Event body: { "question": "...", "recommendationTimestamp": "..." }.
 userID from JWT (requestContext.authorizer.claims.sub or authorizer.sub).
 Env: TABLE_NAME (default T2D), BEDROCK_MODEL_ID (required), BEDROCK_REGION (optional),
-     BEDROCK_KNOWLEDGE_BASE_ID (optional; when set, retrieves from KB and adds to prompt).
+     BEDROCK_KNOWLEDGE_BASE_ID (optional; when set, retrieves from KB and adds to prompt),
+     CONVERSATION_COMPRESS_TOKENS (optional; history size that triggers compaction, default 2000),
+     BEDROCK_SUMMARY_MODEL_ID (optional; cheaper model for compaction, defaults to BEDROCK_MODEL_ID),
+     BEDROCK_STREAMING (optional; "0" to use blocking Converse instead of ConverseStream),
+     BEDROCK_STREAM_READ_TIMEOUT (optional; per-chunk read timeout in seconds, default 15),
+     KB_CACHE_TTL_SECONDS (optional; per-item KB retrieval cache lifetime; default 0 = off,
+     so KB retrieval runs in parallel with the DynamoDB read).
 """
 
+import hashlib
 import json
 import os
-from datetime import datetime
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from decimal import Decimal
 
 try:
     import boto3
+    from botocore.config import Config
     from botocore.exceptions import ClientError
 except ImportError:
     boto3 = None
+    Config = None
     ClientError = Exception
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
 
 def _log(msg):
     print(f"[conversation] {msg}", flush=True)
 
 
+# orjson when packaged, else stdlib; orjson.JSONDecodeError subclasses json.JSONDecodeError
+if orjson is not None:
+    def _json_loads(s):
+        return orjson.loads(s)
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj, default=str).decode("utf-8")
+else:
+    def _json_loads(s):
+        return json.loads(s)
+
+    def _json_dumps(obj):
+        return json.dumps(obj, default=str)
+
+
+# ---------- AWS clients: created once per container, reused across warm invocations ----------
+BOTO_CONFIG = Config(tcp_keepalive=True, retries={"mode": "standard"}, max_pool_connections=10) if Config else None
+# Streaming: a stalled stream fails in seconds instead of waiting out the default 60s read timeout
+BEDROCK_STREAM_CONFIG = BOTO_CONFIG.merge(
+    Config(connect_timeout=5, read_timeout=int(os.environ.get("BEDROCK_STREAM_READ_TIMEOUT") or 15))
+) if Config else None
+# Stop collecting stream chunks when the Lambda has less than this left, so a partial answer is still saved/returned
+STREAM_DEADLINE_MARGIN_MS = 3000
+
+_DDB = None
+_TABLES = {}
+_BEDROCK_RT = {}
+_BEDROCK_RT_STREAM = {}
+_BEDROCK_AGENT_RT = {}
+
+
+def _table(table_name):
+    """DynamoDB Table handle, cached per name across warm invocations."""
+    global _DDB
+    if table_name not in _TABLES:
+        if _DDB is None:
+            _DDB = boto3.resource("dynamodb", config=BOTO_CONFIG)
+        _TABLES[table_name] = _DDB.Table(table_name)
+    return _TABLES[table_name]
+
+
+def _bedrock_client(cache, service_name, region, config=None):
+    """Cached boto3 client for service_name, keyed by region (None = Lambda default region)."""
+    if region not in cache:
+        kwargs = {"service_name": service_name, "config": config or BOTO_CONFIG}
+        if region:
+            kwargs["region_name"] = region
+        cache[region] = boto3.client(**kwargs)
+    return cache[region]
+
+
+def _bedrock_rt(region=None):
+    return _bedrock_client(_BEDROCK_RT, "bedrock-runtime", region)
+
+
+def _bedrock_rt_stream(region=None):
+    """bedrock-runtime client for ConverseStream: tighter per-read timeout since chunks arrive continuously."""
+    return _bedrock_client(_BEDROCK_RT_STREAM, "bedrock-runtime", region, config=BEDROCK_STREAM_CONFIG)
+
+
+def _bedrock_agent_rt(region=None):
+    return _bedrock_client(_BEDROCK_AGENT_RT, "bedrock-agent-runtime", region)
+
+
 def _parse_event(event):
     """Parse body from API Gateway or direct invoke."""
     body = event.get("body", event)
     if isinstance(body, str):
         try:
-            return json.loads(body) if body else {}
+            return _json_loads(body) if body else {}
         except json.JSONDecodeError:
             return {}
     return body if isinstance(body, dict) else {}
 
 
-def _get_user_id(event):
+def _get_user_id(event, parsed_body=None):
     """userID from Cognito JWT (same pattern as feedback.py)."""
     try:
         authorizer = (event.get("requestContext") or {}).get("authorizer") or {}
@@ -54,35 +141,117 @@ def _get_user_id(event):
             return str(sub)
     except Exception:
         pass
-    data = _parse_event(event)
+    data = parsed_body if parsed_body is not None else _parse_event(event)
     return data.get("userID") or data.get("userId")
 
 
+def _has_type(obj, t):
+    """True if obj or any value nested in its dicts/lists is an instance of t (iterative, no allocation beyond the stack)."""
+    stack = [obj]
+    while stack:
+        x = stack.pop()
+        if isinstance(x, t):
+            return True
+        if isinstance(x, dict):
+            stack.extend(x.values())
+        elif isinstance(x, list):
+            stack.extend(x)
+    return False
+
+
 def _to_native(obj):
-    """Convert DynamoDB types (Decimal) to native JSON-serializable."""
+    """Convert DynamoDB types (Decimal) to native JSON-serializable. Returns obj unchanged if it holds no Decimal."""
+    if not _has_type(obj, Decimal):
+        return obj
+    return _to_native_walk(obj)
+
+
+def _to_native_walk(obj):
     if obj is None:
         return None
     if isinstance(obj, Decimal):
         f = float(obj)
         return int(f) if f == int(f) else f
     if isinstance(obj, dict):
-        return {k: _to_native(v) for k, v in obj.items()}
+        return {k: _to_native_walk(v) for k, v in obj.items()}
     if isinstance(obj, list):
-        return [_to_native(v) for v in obj]
+        return [_to_native_walk(v) for v in obj]
     return obj
 
 
-def _to_dynamodb(obj):
-    """Convert floats to Decimal for DynamoDB."""
-    if obj is None:
-        return None
-    if isinstance(obj, float):
-        return Decimal(str(obj))
-    if isinstance(obj, dict):
-        return {k: _to_dynamodb(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [_to_dynamodb(v) for v in obj]
-    return obj
+# Intent keywords for _get_relevant_sections: word-start stems, so inflections (costly, priced, reasoning,
+# following, considered, ...) match like the original substring checks while mid-word hits do not.
+_WHY_RE = re.compile(r"\b(?:why|prefer|instead|alternative|other option|rationale|reason)")
+_COST_RE = re.compile(r"\b(?:cost|cheap|afford|pric|tier)")
+_KIDNEY_RE = re.compile(r"\b(?:kidney|renal|egfr|ckd|glomerular)")
+_FUTURE_RE = re.compile(r"\b(?:future|follow|monitor|consider|later)")
+
+
+# Lookup order for a top3BestOptions entry's display name and cost tier
+_NAME_KEYS = ("medication", "displayName", "drug", "class")
+_TIER_KEYS = ("costTier", "tier")
+
+
+def _name_tier(opt):
+    """(name, tier) for a top3BestOptions entry; name defaults to "Option", tier to ""."""
+    return (
+        next((opt.get(k) for k in _NAME_KEYS if opt.get(k)), "Option"),
+        next((opt.get(k) for k in _TIER_KEYS if opt.get(k)), ""),
+    )
+
+
+def _lines_text(value):
+    """Recommendation field (list of lines or a single value) as newline-joined stripped text."""
+    value = value or []
+    if not isinstance(value, list):
+        value = [value]
+    return "\n".join(str(x).strip() for x in value if x)
+
+
+# ---------- Intent -> sections: each adder(body, sections, top3_cost_lines) fills sections in place ----------
+def _add_rationale_and_alternatives(body, sections, top3_cost_lines):
+    """Why / why not / prefer / alternative: full rationale and alternatives."""
+    sections["rationale"] = _lines_text(body.get("rationale"))
+    sections["alternatives"] = _lines_text(body.get("alternatives"))
+
+
+def _add_cost(body, sections, top3_cost_lines):
+    """Cost / cheapest / afford: top 3 with tiers plus the first 10 drug weights with tiers."""
+    if top3_cost_lines:
+        sections["top3_and_cost"] = "\n".join(top3_cost_lines)
+    all_weights = body.get("allDrugWeights") or []
+    if all_weights and isinstance(all_weights, list):
+        cost_bits = []
+        for w in all_weights[:10]:
+            name = w.get("drug") or w.get("drugName") or w.get("class") or ""
+            tier = w.get("costTier") or w.get("tier") or ""
+            if name:
+                cost_bits.append(f"  - {name}" + (f" ({tier})" if tier else ""))
+        if cost_bits:
+            sections["drug_weights_cost"] = "\n".join(cost_bits)
+
+
+def _add_kidney(body, sections, top3_cost_lines):
+    """Kidney / renal / eGFR: rationale plus eGFR warning flag."""
+    if not sections.get("rationale"):
+        sections["rationale"] = _lines_text(body.get("rationale"))
+    warning = body.get("warning-eGFR") or body.get("warningEGFR")
+    if warning:
+        sections["egfr_warning"] = "eGFR/therapy warning applies; see assessment and rationale."
+
+
+def _add_future(body, sections, top3_cost_lines):
+    """Future / follow-up / monitor: future considerations."""
+    sections["future_considerations"] = _lines_text(body.get("futureConsiderations"))
+
+
+# Evaluated in order; every matching intent contributes its sections
+_INTENT_TABLE = (
+    (_WHY_RE, _add_rationale_and_alternatives),
+    (_COST_RE, _add_cost),
+    (_KIDNEY_RE, _add_kidney),
+    (_FUTURE_RE, _add_future),
+)
 
 
 def _get_relevant_sections(question, conversation_turns, response_body):
@@ -106,85 +275,55 @@ def _get_relevant_sections(question, conversation_turns, response_body):
     if assessment:
         sections["assessment"] = str(assessment).strip()
 
-    # Intent keywords: include rationale and alternatives for "why not", cost, comparison
-    if any(k in combined for k in ("why", "why not", "prefer", "instead", "alternative", "other option", "rationale", "reason")):
-        rationale = body.get("rationale") or []
-        if isinstance(rationale, list):
-            sections["rationale"] = "\n".join(str(x).strip() for x in rationale if x)
-        else:
-            sections["rationale"] = str(rationale).strip()
-        alts = body.get("alternatives") or []
-        if isinstance(alts, list):
-            sections["alternatives"] = "\n".join(str(x).strip() for x in alts if x)
-        else:
-            sections["alternatives"] = str(alts).strip()
-
-    # Cost / cheapest / afford
-    if any(k in combined for k in ("cost", "cheap", "afford", "price", "tier")):
-        top3 = body.get("top3BestOptions") or []
-        if isinstance(top3, list):
-            parts = []
-            for i, opt in enumerate(top3[:3], 1):
-                name = opt.get("medication") or opt.get("displayName") or opt.get("drug") or opt.get("class") or "Option"
-                tier = opt.get("costTier") or opt.get("tier") or ""
-                parts.append(f"  {i}. {name}" + (f" ({tier})" if tier else ""))
-            if parts:
-                sections["top3_and_cost"] = "\n".join(parts)
-        all_weights = body.get("allDrugWeights") or []
-        if all_weights and isinstance(all_weights, list):
-            cost_bits = []
-            for w in all_weights[:10]:
-                name = w.get("drug") or w.get("drugName") or w.get("class") or ""
-                tier = w.get("costTier") or w.get("tier") or ""
-                if name:
-                    cost_bits.append(f"  - {name}" + (f" ({tier})" if tier else ""))
-            if cost_bits:
-                sections["drug_weights_cost"] = "\n".join(cost_bits)
-
-    # Kidney / renal / eGFR
-    if any(k in combined for k in ("kidney", "renal", "egfr", "ckd", "glomerular")):
-        sections["assessment"] = sections.get("assessment", "")  # already have
-        if not sections.get("rationale"):
-            rationale = body.get("rationale") or []
-            if isinstance(rationale, list):
-                sections["rationale"] = "\n".join(str(x).strip() for x in rationale if x)
-            else:
-                sections["rationale"] = str(rationale).strip()
-        warning = body.get("warning-eGFR") or body.get("warningEGFR")
-        if warning:
-            sections["egfr_warning"] = "eGFR/therapy warning applies; see assessment and rationale."
-
-    # Future / follow-up / monitor
-    if any(k in combined for k in ("future", "follow", "monitor", "consider", "later")):
-        future = body.get("futureConsiderations") or []
-        if isinstance(future, list):
-            sections["future_considerations"] = "\n".join(str(x).strip() for x in future if x)
-        else:
-            sections["future_considerations"] = str(future).strip()
+    # Top 3 in one pass: plain list (default) and with cost tier (cost intent)
+    top3 = body.get("top3BestOptions") or []
+    top3_lines, top3_cost_lines = [], []
+    if isinstance(top3, list):
+        for i, opt in enumerate(top3[:3], 1):
+            name, tier = _name_tier(opt)
+            top3_lines.append(f"  {i}. {name}")
+            top3_cost_lines.append(f"  {i}. {name}" + (f" ({tier})" if tier else ""))
+
+    for intent_re, add_sections in _INTENT_TABLE:
+        if intent_re.search(combined):
+            add_sections(body, sections, top3_cost_lines)
 
     # Default: include top3 and rationale so the model has something to work with
-    if "top3_and_cost" not in sections:
-        top3 = body.get("top3BestOptions") or []
-        if isinstance(top3, list):
-            parts = []
-            for i, opt in enumerate(top3[:3], 1):
-                name = opt.get("medication") or opt.get("displayName") or opt.get("drug") or opt.get("class") or "Option"
-                parts.append(f"  {i}. {name}")
-            if parts:
-                sections["top3"] = "\n".join(parts)
+    if "top3_and_cost" not in sections and top3_lines:
+        sections["top3"] = "\n".join(top3_lines)
     if "rationale" not in sections:
-        rationale = body.get("rationale") or []
-        if isinstance(rationale, list):
-            sections["rationale"] = "\n".join(str(x).strip() for x in rationale if x)
-        else:
-            sections["rationale"] = str(rationale).strip()
+        sections["rationale"] = _lines_text(body.get("rationale"))
+
+    return _dedupe_sections(sections)
 
-    return sections
+
+# Per-section cap (chars) and the prefix length used to detect a section already contained in an earlier one
+SECTION_MAX_CHARS = 800
+_SECTION_DEDUPE_KEY_CHARS = 200
+
+
+def _dedupe_sections(sections):
+    """Drop empty sections and any whose opening text already appears in an earlier section; cap each at SECTION_MAX_CHARS."""
+    out = {}
+    seen_lower = []
+    for label, text in sections.items():
+        if not text:
+            continue
+        text_lower = text.lower()
+        key = text_lower[:_SECTION_DEDUPE_KEY_CHARS]
+        if any(key in prev for prev in seen_lower):
+            continue
+        seen_lower.append(text_lower)
+        out[label] = text[:SECTION_MAX_CHARS] + ("..." if len(text) > SECTION_MAX_CHARS else "")
+    return out
 
 
 # ---------- Lightweight guardrails (no Bedrock product; minimal tokens) ----------
 # Max question length (chars) to avoid token blow-up
 QUESTION_MAX_CHARS = 500
+# Reject before any network I/O: under 2 chars, or no letter/digit at all (e.g. "? ? ?"); "A1c?" and "is it ok" pass
+QUESTION_MIN_CHARS = 2
+_Q_GATE = re.compile(r"\w")
 
 # Off-topic: block if question has no relevance to recommendation/diabetes/medication
 _OFF_TOPIC_REJECT_PHRASES = (
@@ -198,6 +337,51 @@ _SAFETY_BLOCK_PHRASES = (
 )
 # PII: don't invite model to store or repeat SSN, etc.
 _PII_PROBE_PHRASES = ("my ssn is", "social security", "my dob is", "remember my", "store my")
+# Signals that an otherwise long question is still about the recommendation (never off-topic)
+_MED_TERMS = (
+    "medication", "drug", "insulin", "metformin", "recommend", "diabetes", "blood sugar", "a1c", "dose", "why",
+    "cost", "alternative", "option", "kidney", "renal", "weight", "glp", "sglt", "oral", "injection",
+)
+_FOLLOWUP_TERMS = ("why ", "what about", "how about", "when ", "can i", "should i", "?")
+
+
+def _phrase_re(phrases):
+    """One compiled alternation (substring semantics, single C-level scan) for a tuple of literal phrases."""
+    return re.compile("|".join(re.escape(p) for p in phrases))
+
+
+# All blocking phrases matched in one linear scan, tagged by category (listed in priority order)
+_GUARDRAIL_PHRASES = (
+    ("safety", _SAFETY_BLOCK_PHRASES),
+    ("pii", _PII_PROBE_PHRASES),
+    ("off_topic", _OFF_TOPIC_REJECT_PHRASES),
+)
+_PHRASE_CATEGORY = {}
+for _cat, _phrases in _GUARDRAIL_PHRASES:
+    for _p in _phrases:
+        _PHRASE_CATEGORY.setdefault(_p, _cat)
+if ahocorasick is not None:
+    _GUARDRAIL_AC = ahocorasick.Automaton()
+    for _p, _cat in _PHRASE_CATEGORY.items():
+        _GUARDRAIL_AC.add_word(_p, _cat)
+    _GUARDRAIL_AC.make_automaton()
+    _GUARDRAIL_RE = None
+else:
+    _GUARDRAIL_AC = None
+    # Lookahead so overlapping phrases are all found; higher-priority phrases first in the alternation
+    _GUARDRAIL_RE = re.compile("(?=(" + "|".join(re.escape(p) for p in _PHRASE_CATEGORY) + "))")
+
+
+def _guardrail_categories(q):
+    """Set of guardrail categories ("safety", "pii", "off_topic") whose phrases occur in q."""
+    if _GUARDRAIL_AC is not None:
+        return {cat for _, cat in _GUARDRAIL_AC.iter(q)}
+    return {_PHRASE_CATEGORY[m.group(1)] for m in _GUARDRAIL_RE.finditer(q)}
+
+
+_MED_TERMS_RE = _phrase_re(_MED_TERMS)
+_FOLLOWUP_RE = _phrase_re(_FOLLOWUP_TERMS)
+
 
 def _input_guardrails(question):
     """
@@ -207,25 +391,186 @@ def _input_guardrails(question):
     if not question or not question.strip():
         return False, None
     q = question.strip().lower()
+    categories = _guardrail_categories(q)
     # Safety first
-    for p in _SAFETY_BLOCK_PHRASES:
-        if p in q:
-            return False, "I can only answer questions about your diabetes medication recommendation. If you're in crisis, please contact a crisis line or 911."
+    if "safety" in categories:
+        return False, "I can only answer questions about your diabetes medication recommendation. If you're in crisis, please contact a crisis line or 911."
     # PII: don't send to model
-    for p in _PII_PROBE_PHRASES:
-        if p in q:
-            return False, "I don't collect or store personal information. Please ask about your medication recommendation."
+    if "pii" in categories:
+        return False, "I don't collect or store personal information. Please ask about your medication recommendation."
     # Off-topic: very loose—only block clearly unrelated
-    if len(q) > 20:
-        has_med = any(x in q for x in ("medication", "drug", "insulin", "metformin", "recommend", "diabetes", "blood sugar", "a1c", "dose", "why", "cost", "alternative", "option", "kidney", "renal", "weight", "glp", "sglt", "oral", "injection"))
-        has_followup = any(x in q for x in ("why ", "what about", "how about", "when ", "can i", "should i", "?"))
+    if len(q) > 20 and "off_topic" in categories:
+        has_med = _MED_TERMS_RE.search(q) is not None
+        has_followup = _FOLLOWUP_RE.search(q) is not None
         if not has_med and not has_followup:
-            for p in _OFF_TOPIC_REJECT_PHRASES:
-                if p in q:
-                    return False, "Please ask a question about your diabetes medication recommendation."
+            return False, "Please ask a question about your diabetes medication recommendation."
     return True, None
 
 
+# ---------- Conversation compression (summary of older turns + recent turns verbatim) ----------
+# Rendered history (summary + uncompacted turns) above this many tokens is compacted
+COMPRESS_THRESHOLD_TOKENS = int(os.environ.get("CONVERSATION_COMPRESS_TOKENS") or 2000)
+# Most recent turns always sent verbatim (never folded into the summary)
+COMPRESS_KEEP_RECENT_TURNS = 2
+# Token estimate for the compaction threshold: ~3 chars per token for English clinical text
+_CHARS_PER_TOKEN = 3
+
+_SUMMARY_SYSTEM = """You compress a clinician's follow-up conversation about a Type 2 Diabetes medication recommendation. Merge the previous summary (if any) and the new turns into one concise summary. Preserve verbatim: drug names, doses, eGFR values, A1C and other numeric labs, allergies, and any decisions or open questions. Drop greetings, filler, and repeated content. Output only the summary text."""
+
+
+def _estimate_tokens(text):
+    """Approximate token count for text (chars / _CHARS_PER_TOKEN); no tokenizer load on cold start."""
+    if not text:
+        return 0
+    return len(text) // _CHARS_PER_TOKEN + 1
+
+
+def _render_turns(turns):
+    """ROLE: content lines for turns with non-empty content."""
+    return "\n".join(
+        f"{(t.get('role') or 'user').upper()}: {c}" for t in turns if (c := (t.get("content") or "").strip())
+    )
+
+
+def _summarize_turns(previous_summary, turns, model_id, region=None):
+    """One cheap Bedrock call folding previous_summary + turns into a new summary. Returns summary text ('' on empty)."""
+    parts = []
+    if previous_summary:
+        parts.append(f"Previous summary:\n{previous_summary}")
+    parts.append(f"New turns:\n{_render_turns(turns)}")
+    summary_model = (os.environ.get("BEDROCK_SUMMARY_MODEL_ID") or "").strip() or model_id
+    summary, input_tokens, output_tokens = _call_bedrock(
+        _SUMMARY_SYSTEM, "\n\n".join(parts), summary_model, region=region, max_tokens=512, temperature=0.0
+    )
+    _log(f"compaction tokens: input={input_tokens} output={output_tokens}")
+    return summary
+
+
+def _maybe_compress_conversation(conversation_native, item, table, user_id, rec_ts, model_id, region=None):
+    """
+    Return (summary, recent_turns) to put in the prompt instead of the raw history.
+    conversationSummary on the item covers conversation[:compactedThrough]. When summary + remaining turns exceed
+    COMPRESS_THRESHOLD_TOKENS, all but the last COMPRESS_KEEP_RECENT_TURNS are folded into a new summary and persisted.
+    Compaction is best-effort: on any failure the existing summary and uncompacted turns are returned.
+    """
+    stored = _to_native(item.get("conversationSummary") or {})
+    summary = (stored.get("summary") or "").strip() if isinstance(stored, dict) else ""
+    compacted_through = int(stored.get("compactedThrough") or 0) if summary else 0
+    compacted_through = max(0, min(compacted_through, len(conversation_native)))
+    pending = conversation_native[compacted_through:]
+    if len(pending) <= COMPRESS_KEEP_RECENT_TURNS:
+        return summary, pending
+    if _estimate_tokens(summary) + _estimate_tokens(_render_turns(pending)) <= COMPRESS_THRESHOLD_TOKENS:
+        return summary, pending
+
+    new_through = len(conversation_native) - COMPRESS_KEEP_RECENT_TURNS
+    try:
+        new_summary = _summarize_turns(summary, conversation_native[compacted_through:new_through], model_id, region)
+    except Exception as e:
+        _log(f"Conversation compaction failed: {e}")
+        return summary, pending
+    if not new_summary:
+        return summary, pending
+    try:
+        # compactedThrough indexes the conversation list as read; a concurrent window trim would shift it,
+        # so write only if the list is unchanged (same guard as _window_update)
+        table.update_item(
+            Key={"userID": str(user_id), "timestamp": str(rec_ts)},
+            UpdateExpression="SET conversationSummary = :s",
+            ConditionExpression="size(conversation) = :stored_len",
+            ExpressionAttributeValues={
+                ":s": {"summary": new_summary, "compactedThrough": new_through},
+                ":stored_len": len(conversation_native),
+            },
+        )
+    except ClientError as e:
+        _log(f"Failed to save conversation summary: {e}")
+        # Still use the new summary for this prompt
+    _log(f"Conversation compacted through turn {new_through}")
+    return new_summary, conversation_native[new_through:]
+
+
+# ---------- Per-item KB retrieval cache (kbCache: { queryHash: { section, chunks, ts } }) ----------
+# Off by default: a cache miss serializes get_item -> retrieve, so enable only where repeat questions are common
+KB_CACHE_TTL_SECONDS = int(os.environ.get("KB_CACHE_TTL_SECONDS") or 0)
+KB_CACHE_MAX_ENTRIES = 10
+
+
+def _kb_query_hash(query):
+    """Stable short key for a retrieval query (case/whitespace-insensitive)."""
+    return hashlib.blake2b((query or "").lower().strip().encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _kb_cache_lookup(kb_cache, query_hash, now):
+    """Return (section, chunk_count) for a fresh cache entry, else None."""
+    entry = kb_cache.get(query_hash) if isinstance(kb_cache, dict) else None
+    if not isinstance(entry, dict) or now - int(entry.get("ts") or 0) > KB_CACHE_TTL_SECONDS:
+        return None
+    return entry.get("section") or "", int(entry.get("chunks") or 0)
+
+
+def _kb_cache_put(kb_cache, query_hash, section, chunk_count, now):
+    """Return a new kbCache map with this entry added; expired entries dropped, oldest evicted past KB_CACHE_MAX_ENTRIES."""
+    entries = {
+        h: e for h, e in (kb_cache.items() if isinstance(kb_cache, dict) else ())
+        if isinstance(e, dict) and now - int(e.get("ts") or 0) <= KB_CACHE_TTL_SECONDS
+    }
+    entries[query_hash] = {"section": section, "chunks": chunk_count, "ts": now}
+    if len(entries) > KB_CACHE_MAX_ENTRIES:
+        keep = sorted(entries, key=lambda h: int(entries[h].get("ts") or 0))[-KB_CACHE_MAX_ENTRIES:]
+        entries = {h: entries[h] for h in keep}
+    return entries
+
+
+# ---------- Bounded conversation attribute (rolling window; older turns live only in conversationSummary) ----------
+# Keeps the item well under DynamoDB's 400KB limit and bounds read size for every turn
+CONVERSATION_WINDOW_TURNS = 20
+
+
+def _window_update(conversation, conversation_native, new_turn_dynamo, summary, compacted_through, model_id, region=None):
+    """
+    Update parts that keep only the last CONVERSATION_WINDOW_TURNS turns once the new turn would overflow the window.
+    Evicted turns not already covered by the summary (conversation[:compacted_through]) are folded into it first.
+    Returns None when nothing needs evicting or the summary cannot be produced (caller appends as usual).
+    """
+    n_evict = len(conversation) + len(new_turn_dynamo) - CONVERSATION_WINDOW_TURNS
+    if n_evict <= 0:
+        return None
+    if compacted_through < n_evict:
+        try:
+            summary = _summarize_turns(summary, conversation_native[compacted_through:n_evict], model_id, region)
+        except Exception as e:
+            _log(f"Conversation window summary failed: {e}")
+            return None
+        if not summary:
+            return None
+        compacted_through = n_evict
+    _log(f"Conversation window: evicting {n_evict} turns into summary")
+    return {
+        "set": ["conversation = :tail", "conversationSummary = :summary"],
+        "add": ["turnsEvicted :n"],
+        "values": {
+            ":tail": (conversation + new_turn_dynamo)[n_evict:],
+            ":summary": {"summary": summary, "compactedThrough": compacted_through - n_evict},
+            ":n": n_evict,
+            ":stored_len": len(conversation),
+        },
+        # Overwrites the list, so only if no other turn was appended since the read
+        "condition": "size(conversation) = :stored_len",
+    }
+
+
+def _update_item_kwargs(parts):
+    """UpdateItem kwargs from {set: [...], add: [...], values: {...}, condition: str}."""
+    expr = "SET " + ", ".join(parts["set"])
+    if parts.get("add"):
+        expr += " ADD " + ", ".join(parts["add"])
+    kwargs = {"UpdateExpression": expr, "ExpressionAttributeValues": parts["values"]}
+    if parts.get("condition"):
+        kwargs["ConditionExpression"] = parts["condition"]
+    return kwargs
+
+
 def _retrieve_from_bedrock_kb(knowledge_base_id, query, region=None, number_of_results=5, score_threshold=0.3):
     """Retrieve relevant chunks from a Bedrock Knowledge Base. Returns (content_string, chunk_count).
     content_string is XML-wrapped for the prompt; only chunks with score > score_threshold are kept."""
@@ -233,10 +578,7 @@ def _retrieve_from_bedrock_kb(knowledge_base_id, query, region=None, number_of_r
         return "", 0
     kb_id = (knowledge_base_id or "").strip()
     try:
-        kwargs = {"service_name": "bedrock-agent-runtime"}
-        if region:
-            kwargs["region_name"] = region
-        client = boto3.client(**kwargs)
+        client = _bedrock_agent_rt(region)
         request_params = {
             "knowledgeBaseId": kb_id,
             "retrievalQuery": {"text": (query or "")[:8000]},
@@ -265,57 +607,66 @@ def _retrieve_from_bedrock_kb(knowledge_base_id, query, region=None, number_of_r
         return "", 0
 
 
-def _build_prompt(question, conversation_turns, relevant_sections, kb_references_section=None):
-    """Build system and user message for Bedrock.
-    kb_references_section: optional string from Knowledge Base retrieval to include in the prompt."""
-    question = (question or "").strip()
-    system = """You are a Type 2 Diabetes medication expert answering clinician questions (recommendations, results, other T2D questions). Use only the recommendation context and KB references below. Answer professionally and concisely (1–3 sentences). You may: answer beyond the recommendation; support communication/health literacy; add note context; counsel on new-therapy factors; give nutrition guidance; explain T2 management. Never ask for PHI/PII. If the answer is not in the context or KB, respond exactly: "Sorry, we do not have the exact answer for your question and do not want to steer you in the wrong direction. I would recommend referring to either the American Diabetes Association page, respective medical calculators or drug specific package insert material for more specifics on this inquiry." Do not invent clinical details."""
+# Static system prompt: built once per container. No cachePoint: at ~200 tokens it is under the 1024-token
+# minimum Bedrock caches, so a cache marker would only add request overhead.
+_SYSTEM_DEFAULT = """You are a Type 2 Diabetes medication expert answering clinician questions (recommendations, results, other T2D questions). Use only the recommendation context and KB references below. Answer professionally and concisely (1–3 sentences). You may: answer beyond the recommendation; support communication/health literacy; add note context; counsel on new-therapy factors; give nutrition guidance; explain T2 management. Never ask for PHI/PII. If the answer is not in the context or KB, respond exactly: "Sorry, we do not have the exact answer for your question and do not want to steer you in the wrong direction. I would recommend referring to either the American Diabetes Association page, respective medical calculators or drug specific package insert material for more specifics on this inquiry." Do not invent clinical details."""
 
-    context_parts = []
-    for label, text in relevant_sections.items():
-        if text:
-            context_parts.append(f"## {label}\n{text}")
-    context_block = "\n\n".join(context_parts) if context_parts else "(No sections selected)"
+# Inference settings per question type. Answers are 1–3 sentences, so maxTokens is a tight ceiling, not a target;
+# short questions with no cost/kidney/why intent get an even smaller budget.
+_INFER_PROFILES = {
+    "default": {"max_tokens": 512, "temperature": 0.1},
+    "short": {"max_tokens": 256, "temperature": 0.1},
+}
+_SHORT_QUESTION_CHARS = 60
+_LONG_ANSWER_RES = (_WHY_RE, _COST_RE, _KIDNEY_RE)
 
-    kb_block = ""
-    if kb_references_section and (kb_references_section or "").strip():
-        kb_block = f"""## Knowledge base references (use to support your answer)
 
-{kb_references_section.strip()}
+def _inference_profile(question):
+    """Pick _INFER_PROFILES entry for the question (kwargs for _call_bedrock / _call_bedrock_stream)."""
+    q = (question or "").lower()
+    if len(q) < _SHORT_QUESTION_CHARS and not any(r.search(q) for r in _LONG_ANSWER_RES):
+        return _INFER_PROFILES["short"]
+    return _INFER_PROFILES["default"]
 
-"""
 
-    conv_block = ""
+def _build_prompt(question, conversation_turns, relevant_sections, kb_references_section=None, conversation_summary=None):
+    """Build system and user message for Bedrock.
+    kb_references_section: optional string from Knowledge Base retrieval to include in the prompt.
+    conversation_summary: optional summary of older turns; when set, conversation_turns are the uncompacted tail."""
+    question = (question or "").strip()
+    system = _SYSTEM_DEFAULT
+
+    context_parts = [f"## {label}\n{text}" for label, text in relevant_sections.items() if text]
+
+    # Assemble once with a single join (no intermediate kb/conv block strings re-interpolated into a template)
+    fragments = []
+    kb_text = (kb_references_section or "").strip()
+    if kb_text:
+        fragments.extend(("## Knowledge base references (use to support your answer)\n\n", kb_text, "\n\n"))
+    fragments.append("## Recommendation context (relevant sections only)\n\n")
+    fragments.append("\n\n".join(context_parts) if context_parts else "(No sections selected)")
+    fragments.append("\n\n")
+
+    summary = (conversation_summary or "").strip()
+    if summary:
+        fragments.extend(("Earlier conversation (summary):\n", summary, "\n\n"))
     if conversation_turns:
-        last_n = conversation_turns[-6:]
-        lines = []
-        for t in last_n:
-            role = t.get("role", "user")
-            content = (t.get("content") or "").strip()
-            if content:
-                lines.append(f"{role.upper()}: {content}")
-        if lines:
-            conv_block = "Recent conversation:\n" + "\n".join(lines) + "\n\n"
-
-    user_content = f"""{kb_block}## Recommendation context (relevant sections only)
-
-{context_block}
+        # With a summary the tail is already bounded by compaction; otherwise cap at the last 6 turns
+        rendered = _render_turns(conversation_turns if summary else conversation_turns[-6:])
+        if rendered:
+            fragments.extend(("Recent conversation:\n", rendered, "\n\n"))
 
-{conv_block}User question: {question}
-
-Provide a concise answer in 1–3 sentences based on the context and knowledge base references above."""
+    fragments.extend((
+        "User question: ", question,
+        "\n\nProvide a concise answer in 1–3 sentences based on the context and knowledge base references above.",
+    ))
+    user_content = "".join(fragments)
 
     return system, user_content
 
 
-def _call_bedrock(system_message, user_message, model_id, region=None, max_tokens=1024, temperature=0.2):
-    """Call Bedrock Converse API; return (answer_text, input_tokens, output_tokens)."""
-    if not boto3:
-        raise RuntimeError("boto3 not available")
-    kwargs = {"service_name": "bedrock-runtime"}
-    if region:
-        kwargs["region_name"] = region
-    client = boto3.client(**kwargs)
+def _converse_request(system_message, user_message, model_id, max_tokens, temperature):
+    """Request kwargs shared by converse and converse_stream."""
     model_id = (model_id or "").strip()
     if not model_id:
         raise ValueError("BEDROCK_MODEL_ID is not set")
@@ -327,6 +678,15 @@ def _call_bedrock(system_message, user_message, model_id, region=None, max_token
     }
     if system_message:
         request_kw["system"] = [{"text": system_message}]
+    return request_kw
+
+
+def _call_bedrock(system_message, user_message, model_id, region=None, max_tokens=1024, temperature=0.2):
+    """Call Bedrock Converse API; return (answer_text, input_tokens, output_tokens)."""
+    if not boto3:
+        raise RuntimeError("boto3 not available")
+    client = _bedrock_rt(region)
+    request_kw = _converse_request(system_message, user_message, model_id, max_tokens, temperature)
     response = client.converse(**request_kw)
     usage = response.get("usage") or {}
     input_tokens = int(usage.get("inputTokens", 0))
@@ -342,11 +702,45 @@ def _call_bedrock(system_message, user_message, model_id, region=None, max_token
     return answer, input_tokens, output_tokens
 
 
+def _call_bedrock_stream(system_message, user_message, model_id, region=None, max_tokens=1024, temperature=0.2, should_stop=None):
+    """Same contract as _call_bedrock but via ConverseStream: first tokens arrive in ~hundreds of ms and
+    read timeouts apply per chunk, not to the whole answer. API Gateway (REST) cannot stream, so chunks are
+    aggregated; should_stop() is polled between chunks (e.g. Lambda deadline) and a partial answer is returned."""
+    if not boto3:
+        raise RuntimeError("boto3 not available")
+    client = _bedrock_rt_stream(region)
+    request_kw = _converse_request(system_message, user_message, model_id, max_tokens, temperature)
+    response = client.converse_stream(**request_kw)
+    stream = response.get("stream") or []
+    text_parts = []
+    input_tokens = output_tokens = 0
+    for event in stream:
+        if "contentBlockDelta" in event:
+            text = (event["contentBlockDelta"].get("delta") or {}).get("text")
+            if text:
+                text_parts.append(text)
+        elif "metadata" in event:
+            usage = event["metadata"].get("usage") or {}
+            input_tokens = int(usage.get("inputTokens", 0))
+            output_tokens = int(usage.get("outputTokens", 0))
+        if should_stop is not None and should_stop():
+            _log("Bedrock stream stopped early (deadline); returning partial answer")
+            if hasattr(stream, "close"):
+                stream.close()
+            break
+    answer = "".join(text_parts).strip()
+    return answer, input_tokens, output_tokens
+
+
+# Shared across responses (API Gateway does not mutate it)
+_RESPONSE_HEADERS = {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"}
+
+
 def _response(status_code, body):
     return {
         "statusCode": status_code,
-        "headers": {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
-        "body": json.dumps(body, default=str),
+        "headers": _RESPONSE_HEADERS,
+        "body": _json_dumps(body),
     }
 
 
@@ -357,7 +751,7 @@ def handler(event, context):
     """
     try:
         data = _parse_event(event)
-        user_id = _get_user_id(event)
+        user_id = _get_user_id(event, data)
         if not user_id:
             _log("Missing userID (auth required)")
             return _response(400, {"error": "Missing userID (Cognito auth required)"})
@@ -367,6 +761,8 @@ def handler(event, context):
         rec_ts = rec_ts.strip() if isinstance(rec_ts, str) else ""
         if not question:
             return _response(400, {"error": "Missing question"})
+        if len(question) < QUESTION_MIN_CHARS or not _Q_GATE.search(question):
+            return _response(400, {"error": "Question too short"})
         if not rec_ts:
             return _response(400, {"error": "Missing recommendationTimestamp"})
 
@@ -384,29 +780,66 @@ def handler(event, context):
         if not boto3:
             return _response(500, {"error": "boto3 not available"})
 
-        dynamodb = boto3.resource("dynamodb")
-        table = dynamodb.Table(table_name)
+        table = _table(table_name)
 
-        # Load recommendation item (request, response, conversation)
-        try:
-            resp = table.get_item(
+        # Optional: retrieve from Bedrock Knowledge Base (files you sync to the KB)
+        kb_id = (os.environ.get("BEDROCK_KNOWLEDGE_BASE_ID") or "").strip()
+        bedrock_region = (os.environ.get("BEDROCK_REGION") or "").strip() or None
+        retrieval_query = f"Diabetes medication recommendation follow-up: {question}"
+
+        # With the per-item KB cache on, retrieval waits for the item so a cache hit skips the RPC entirely
+        kb_cache_on = bool(kb_id) and KB_CACHE_TTL_SECONDS > 0
+
+        # Load recommendation item (response, conversation) and, when uncached, KB chunks in parallel:
+        # the retrieval query depends only on the question, so latency is max(ddb, kb) instead of the sum
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            ddb_future = executor.submit(
+                table.get_item,
                 Key={"userID": str(user_id), "timestamp": str(rec_ts)},
+                # Only the attributes this Lambda reads (skip request / allDrugWeights-heavy extras)
+                ProjectionExpression="#resp, conversation, conversationSummary" + (", kbCache" if kb_cache_on else ""),
+                ExpressionAttributeNames={"#resp": "response"},
             )
-        except ClientError as e:
-            _log(f"DynamoDB get_item error: {e}")
-            return _response(500, {"error": str(e)})
+            kb_future = executor.submit(
+                _retrieve_from_bedrock_kb, kb_id, retrieval_query, region=bedrock_region, number_of_results=3
+            ) if kb_id and not kb_cache_on else None
+            try:
+                resp = ddb_future.result()
+            except ClientError as e:
+                _log(f"DynamoDB get_item error: {e}")
+                return _response(500, {"error": str(e)})
+            kb_section, kb_chunk_count = kb_future.result() if kb_future else ("", 0)
 
         item = resp.get("Item")
         if not item:
             _log(f"Item not found userID={user_id!r} timestamp={rec_ts!r}")
             return _response(404, {"error": "Recommendation not found for this timestamp."})
 
-        request_data = _to_native(item.get("request") or {})
+        new_kb_cache = None
+        if kb_cache_on:
+            now_s = int(time.time())
+            kb_hash = _kb_query_hash(retrieval_query)
+            kb_cache = _to_native(item.get("kbCache") or {})
+            cached = _kb_cache_lookup(kb_cache, kb_hash, now_s)
+            if cached is not None:
+                kb_section, kb_chunk_count = cached
+                _log(f"Knowledge base: cache hit ({kb_chunk_count} chunks)")
+            else:
+                kb_section, kb_chunk_count = _retrieve_from_bedrock_kb(
+                    kb_id, retrieval_query, region=bedrock_region, number_of_results=3
+                )
+                if kb_chunk_count:
+                    _log(f"Knowledge base: retrieved {kb_chunk_count} chunks")
+                    # Saved with the conversation turn below (same UpdateItem)
+                    new_kb_cache = _kb_cache_put(kb_cache, kb_hash, kb_section, kb_chunk_count, now_s)
+        elif kb_chunk_count:
+            _log(f"Knowledge base: retrieved {kb_chunk_count} chunks")
+
         response_payload = item.get("response") or {}
         response_body = response_payload.get("body")
         if isinstance(response_body, str):
             try:
-                response_body = json.loads(response_body)
+                response_body = _json_loads(response_body)
             except json.JSONDecodeError:
                 response_body = {}
         response_body = _to_native(response_body or {})
@@ -421,62 +854,102 @@ def handler(event, context):
         # Relevant sections from intent (conversation + question)
         relevant = _get_relevant_sections(question, conversation_native, response_body)
 
-        # Optional: retrieve from Bedrock Knowledge Base (files you sync to the KB)
-        kb_id = (os.environ.get("BEDROCK_KNOWLEDGE_BASE_ID") or "").strip()
-        bedrock_region = (os.environ.get("BEDROCK_REGION") or "").strip() or None
-        kb_section = ""
-        if kb_id:
-            retrieval_query = f"Diabetes medication recommendation follow-up: {question}"
-            kb_section, kb_chunk_count = _retrieve_from_bedrock_kb(
-                kb_id, retrieval_query, region=bedrock_region, number_of_results=3
-            )
-            if kb_chunk_count:
-                _log(f"Knowledge base: retrieved {kb_chunk_count} chunks")
-
-        system_msg, user_msg = _build_prompt(
-            question, conversation_native, relevant, kb_references_section=kb_section or None
-        )
-
         # Same env vars as ClinicalCalcs: no default model; require BEDROCK_MODEL_ID
         model_id = (os.environ.get("BEDROCK_MODEL_ID") or "").strip()
         if not model_id:
             _log("BEDROCK_MODEL_ID not set")
             return _response(503, {"error": "BEDROCK_MODEL_ID is not configured. Set it to the same value as your ClinicalCalcs Lambda."})
 
-        answer, input_tokens, output_tokens = _call_bedrock(
-            system_msg, user_msg, model_id, region=bedrock_region
+        # Older turns -> stored summary; only summary + recent turns are sent to Bedrock
+        conversation_summary, recent_turns = _maybe_compress_conversation(
+            conversation_native, item, table, user_id, rec_ts, model_id, region=bedrock_region
         )
+
+        system_msg, user_msg = _build_prompt(
+            question, recent_turns, relevant, kb_references_section=kb_section or None,
+            conversation_summary=conversation_summary or None,
+        )
+
+        profile = _inference_profile(question)
+        truncated = False
+        if os.environ.get("BEDROCK_STREAMING", "1") != "0":
+            should_stop = None
+            if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+                def should_stop():
+                    """Lambda deadline check; records the cut so the partial answer is flagged truncated."""
+                    nonlocal truncated
+                    truncated = context.get_remaining_time_in_millis() < STREAM_DEADLINE_MARGIN_MS
+                    return truncated
+            answer, input_tokens, output_tokens = _call_bedrock_stream(
+                system_msg, user_msg, model_id, region=bedrock_region, should_stop=should_stop, **profile,
+            )
+        else:
+            answer, input_tokens, output_tokens = _call_bedrock(
+                system_msg, user_msg, model_id, region=bedrock_region, **profile,
+            )
         _log(
             f"tokens: input={input_tokens} output={output_tokens} total={input_tokens + output_tokens}"
         )
 
         # Append turn to conversation and persist
-        now = datetime.utcnow().isoformat() + "Z"
-        new_turn = [
+        # One UTC timestamp (ms precision) shared by both turns; utcnow() is deprecated
+        now = datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+        # Strings only, so already DynamoDB-safe (no float -> Decimal conversion needed)
+        new_turn_dynamo = [
             {"role": "user", "content": question, "timestamp": now},
             {"role": "assistant", "content": answer, "timestamp": now},
         ]
-        new_turn_dynamo = _to_dynamodb(new_turn)
-        existing = conversation if isinstance(conversation, list) else []
-        updated_list = list(existing) + new_turn_dynamo
-        updated_list_dynamo = _to_dynamodb(updated_list)
+        if truncated:
+            new_turn_dynamo[1]["truncated"] = True
 
+        key = {"userID": str(user_id), "timestamp": str(rec_ts)}
+        window_kw = _window_update(
+            conversation, conversation_native, new_turn_dynamo, conversation_summary,
+            len(conversation_native) - len(recent_turns), model_id, region=bedrock_region,
+        )
+        if window_kw is not None:
+            update_kw = window_kw
+        elif isinstance(item.get("conversation"), list) or item.get("conversation") is None:
+            # Server-side append: only the new turn crosses the wire, and concurrent turns cannot overwrite each other
+            update_kw = {
+                "set": ["conversation = list_append(if_not_exists(conversation, :empty), :turn)"],
+                "values": {":empty": [], ":turn": new_turn_dynamo},
+            }
+        else:
+            # Legacy single-map attribute: rewrite once as a list so later turns can append
+            update_kw = {
+                "set": ["conversation = :conv"],
+                "values": {":conv": conversation + new_turn_dynamo},
+            }
+        if new_kb_cache is not None:
+            update_kw["set"].append("kbCache = :kb")
+            update_kw["values"][":kb"] = new_kb_cache
         try:
-            table.update_item(
-                Key={"userID": str(user_id), "timestamp": str(rec_ts)},
-                UpdateExpression="SET conversation = :conv",
-                ExpressionAttributeValues={":conv": updated_list_dynamo},
-            )
+            try:
+                table.update_item(Key=key, **_update_item_kwargs(update_kw))
+            except ClientError as e:
+                if window_kw is None or e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                    raise
+                # Another turn landed since our read; append instead of overwriting it (window trims next turn)
+                _log("Conversation changed concurrently; appending without window trim")
+                table.update_item(
+                    Key=key,
+                    UpdateExpression="SET conversation = list_append(if_not_exists(conversation, :empty), :turn)",
+                    ExpressionAttributeValues={":empty": [], ":turn": new_turn_dynamo},
+                )
         except ClientError as e:
             _log(f"Failed to save conversation: {e}")
             # Still return the answer; persistence is best-effort
 
-        return _response(200, {
+        out = {
             "answer": answer,
             "inputTokens": input_tokens,
             "outputTokens": output_tokens,
             "totalTokens": input_tokens + output_tokens,
-        })
+        }
+        if truncated:
+            out["truncated"] = True
+        return _response(200, out)
 
     except Exception as e:
         _log(f"Error: {e}")
@@ -8,7 +8,6 @@ userID from Cognito JWT. recommendationTimestamp required to identify the recomm
 """
 import json
 import os
-from decimal import Decimal
 
 try:
     import boto3
@@ -17,18 +16,38 @@ except ImportError:
     boto3 = None
     ClientError = Exception
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson when packaged, else stdlib; orjson.JSONDecodeError subclasses json.JSONDecodeError
+if orjson is not None:
+    def _json_loads(s):
+        return orjson.loads(s)
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj, default=str).decode("utf-8")
+else:
+    def _json_loads(s):
+        return json.loads(s)
+
+    def _json_dumps(obj):
+        return json.dumps(obj, default=str)
+
+
+_DDB = None
+_TABLES = {}
 
-def _to_dynamodb(obj):
-    """Convert floats to Decimal for DynamoDB compatibility."""
-    if obj is None:
-        return None
-    if isinstance(obj, float):
-        return Decimal(str(obj))
-    if isinstance(obj, dict):
-        return {k: _to_dynamodb(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [_to_dynamodb(v) for v in obj]
-    return obj
+
+def _table(table_name):
+    """DynamoDB Table handle, cached per name across warm invocations."""
+    global _DDB
+    if table_name not in _TABLES:
+        if _DDB is None:
+            _DDB = boto3.resource("dynamodb")
+        _TABLES[table_name] = _DDB.Table(table_name)
+    return _TABLES[table_name]
 
 
 def _parse_event(event):
@@ -36,13 +55,13 @@ def _parse_event(event):
     body = event.get("body", event)
     if isinstance(body, str):
         try:
-            return json.loads(body) if body else {}
+            return _json_loads(body) if body else {}
         except json.JSONDecodeError:
             return {}
     return body if isinstance(body, dict) else {}
 
 
-def _get_user_id(event):
+def _get_user_id(event, parsed_body=None):
     """Get userID: prefer Cognito JWT claims (requestContext.authorizer.claims.sub), else body."""
     try:
         claims = (event.get("requestContext") or {}).get("authorizer") or {}
@@ -55,10 +74,25 @@ def _get_user_id(event):
             return str(sub)
     except Exception:
         pass
-    data = _parse_event(event)
+    data = parsed_body if parsed_body is not None else _parse_event(event)
     return data.get("userID") or data.get("userId")
 
 
+def _error_code(e):
+    return (getattr(e, "response", None) or {}).get("Error", {}).get("Code")
+
+
+def _append_feedback(table, key, feedback_obj):
+    """Atomic server-side append (no read-modify-write race); the condition keeps 404 semantics for a missing recommendation."""
+    table.update_item(
+        Key=key,
+        UpdateExpression="SET feedback = list_append(if_not_exists(feedback, :empty), :fb)",
+        ConditionExpression="attribute_exists(#req)",
+        ExpressionAttributeNames={"#req": "request"},
+        ExpressionAttributeValues={":fb": [feedback_obj], ":empty": []},
+    )
+
+
 def handler(event, context):
     """
     Updates the recommendation history item with feedback.
@@ -68,7 +102,7 @@ def handler(event, context):
     """
     try:
         data = _parse_event(event)
-        user_id = _get_user_id(event)
+        user_id = _get_user_id(event, data)
 
         if not user_id:
             return _response(400, {"error": "Missing userID (Cognito auth required)", "save": "fail"})
@@ -95,50 +129,47 @@ def handler(event, context):
         if not boto3:
             return _response(500, {"error": "boto3 not available", "save": "fail"})
 
-        # Build feedback object: rating, feedbackText, submittedAt (when user submitted)
+        # Build feedback object: rating, feedbackText, submittedAt (when user submitted).
+        # int + strings only, so it is already DynamoDB-safe (no float -> Decimal conversion needed)
         feedback_obj = {
             "rating": rating,
             "feedbackText": feedback_text,
             "submittedAt": (data.get("timestamp") or "").strip(),
         }
-        feedback_dynamo = _to_dynamodb(feedback_obj)
 
-        dynamodb = boto3.resource("dynamodb")
-        table = dynamodb.Table(table_name)
+        table = _table(table_name)
         region = os.environ.get("AWS_REGION", "")
         print(f"[feedback] table={table_name} region={region} key userID={user_id!r} timestamp={rec_timestamp!r}")
 
+        key = {"userID": str(user_id), "timestamp": str(rec_timestamp)}
         try:
-            # Get current item to append (handle legacy single-object or list format)
-            resp = table.get_item(
-                Key={"userID": str(user_id), "timestamp": str(rec_timestamp)},
-                ProjectionExpression="#req, feedback",
-                ExpressionAttributeNames={"#req": "request"},
-            )
-            item = resp.get("Item")
-            if not item or "request" not in item:
-                print(f"[feedback] item not found for userID={user_id!r} timestamp={rec_timestamp!r}")
-                return _response(404, {
-                    "error": "Recommendation not found. The timestamp may not match any saved recommendation.",
-                    "save": "fail",
-                })
-
-            current = item.get("feedback")
-            if current is None:
-                new_list = [feedback_dynamo]
-            elif isinstance(current, list):
-                new_list = current + [feedback_dynamo]
-            else:
-                # Legacy: was single map, convert to list and append
-                new_list = [current, feedback_dynamo]
-
-            new_list_dynamo = _to_dynamodb(new_list)
-
-            table.update_item(
-                Key={"userID": str(user_id), "timestamp": str(rec_timestamp)},
-                UpdateExpression="SET feedback = :fb",
-                ExpressionAttributeValues={":fb": new_list_dynamo},
-            )
+            try:
+                _append_feedback(table, key, feedback_obj)
+            except ClientError as e:
+                code = _error_code(e)
+                if code == "ConditionalCheckFailedException":
+                    print(f"[feedback] item not found for userID={user_id!r} timestamp={rec_timestamp!r}")
+                    return _response(404, {
+                        "error": "Recommendation not found. The timestamp may not match any saved recommendation.",
+                        "save": "fail",
+                    })
+                if code != "ValidationException":
+                    raise
+                # Legacy: feedback stored as a single map (list_append rejects it); convert to list and append.
+                # Conditional on it still being a map so a concurrent submission's append is never overwritten.
+                current = table.get_item(Key=key, ProjectionExpression="feedback", ConsistentRead=True).get("Item", {}).get("feedback")
+                try:
+                    table.update_item(
+                        Key=key,
+                        UpdateExpression="SET feedback = :fb",
+                        ConditionExpression="attribute_type(feedback, :map)",
+                        ExpressionAttributeValues={":fb": [current, feedback_obj], ":map": "M"},
+                    )
+                except ClientError as e2:
+                    if _error_code(e2) != "ConditionalCheckFailedException":
+                        raise
+                    # Another submission converted it to a list in the meantime
+                    _append_feedback(table, key, feedback_obj)
             print(f"[feedback] appended userID={user_id} timestamp={rec_timestamp} (check attribute 'feedback' on this item in table {table_name})")
             return _response(200, {
                 "updated": True,
@@ -153,11 +184,15 @@ def handler(event, context):
         return _response(500, {"error": str(e), "save": "fail"})
 
 
+# Shared across responses (API Gateway does not mutate it)
+_RESPONSE_HEADERS = {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"}
+
+
 def _response(status_code, body):
     return {
         "statusCode": status_code,
-        "headers": {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
-        "body": json.dumps(body, default=str),
+        "headers": _RESPONSE_HEADERS,
+        "body": _json_dumps(body),
     }
 
 
@@ -8,7 +8,6 @@ Returns the 15 most recent logs:
 """
 import json
 import os
-import re
 
 from decimal import Decimal
 
@@ -17,27 +16,98 @@ try:
 except ImportError:
     boto3 = None
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson when packaged, else stdlib; orjson.JSONDecodeError subclasses json.JSONDecodeError
+if orjson is not None:
+    def _json_loads(s):
+        return orjson.loads(s)
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj, default=str).decode("utf-8")
+else:
+    def _json_loads(s):
+        return json.loads(s)
+
+    def _json_dumps(obj):
+        return json.dumps(obj, default=str)
+
+
+# Per-request trace lines only when DEBUG_LOGS=1; errors are always printed
+if os.environ.get("DEBUG_LOGS") == "1":
+    def _log(msg):
+        print(f"[get_history] {msg}", flush=True)
+else:
+    def _log(msg):
+        pass
+
+
+_DDB = None
+_TABLES = {}
+
+
+def _table(table_name):
+    """DynamoDB Table handle, cached per name across warm invocations."""
+    global _DDB
+    if table_name not in _TABLES:
+        if _DDB is None:
+            _DDB = boto3.resource("dynamodb")
+        _TABLES[table_name] = _DDB.Table(table_name)
+    return _TABLES[table_name]
+
+
+def _has_type(obj, t):
+    """True if obj or any value nested in its dicts/lists is an instance of t (iterative, no allocation beyond the stack)."""
+    stack = [obj]
+    while stack:
+        x = stack.pop()
+        if isinstance(x, t):
+            return True
+        if isinstance(x, dict):
+            stack.extend(x.values())
+        elif isinstance(x, list):
+            stack.extend(x)
+    return False
+
 
 def _to_native(obj):
-    """Convert DynamoDB types (Decimal) to native JSON-serializable types."""
-    if obj is None:
-        return None
-    if isinstance(obj, Decimal):
-        f = float(obj)
-        return int(f) if f == int(f) else f
-    if isinstance(obj, dict):
-        return {k: _to_native(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [_to_native(v) for v in obj]
-    return obj
+    """Convert DynamoDB types (Decimal) to native JSON-serializable types. Returns obj unchanged when it holds no Decimals (common case)."""
+    if not _has_type(obj, Decimal):
+        return obj
+    return _to_native_walk(obj)
+
+
+def _to_native_walk(obj):
+    """Iterative (explicit stack of (node, parent, key)) so deep/large items cost no Python frame per node."""
+    out = [None]
+    stack = [(obj, out, 0)]
+    while stack:
+        node, parent, key = stack.pop()
+        if isinstance(node, Decimal):
+            f = float(node)
+            parent[key] = int(f) if f == int(f) else f
+        elif isinstance(node, dict):
+            new = parent[key] = dict.fromkeys(node)  # keys placed now so order is preserved
+            stack.extend((v, new, k) for k, v in node.items())
+        elif isinstance(node, list):
+            new = parent[key] = [None] * len(node)
+            stack.extend((v, new, i) for i, v in enumerate(node))
+        else:
+            parent[key] = node
+    return out[0]
 
 
 def _truncate_timestamp_for_id(ts):
     """Truncate ISO timestamp to YYYY-MM-DDTHH:MM:SSZ (no fractional seconds)."""
     if not ts or not isinstance(ts, str):
         return ts or ""
-    m = re.match(r"(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})", ts)
-    return f"{m.group(1)}Z" if m else ts
+    # Fixed-width prefix: slice instead of regex; separator check keeps non-ISO values untouched
+    if len(ts) < 19 or ts[4] + ts[7] + ts[10] + ts[13] + ts[16] != "--T::":
+        return ts
+    return ts[:19] + "Z"
 
 
 def _extract_glucose_averages(request_data):
@@ -65,7 +135,7 @@ def _form_data_with_glucose_averages(request_data):
     out = dict(request_data)
     avgs = _extract_glucose_averages(request_data)
     if avgs:
-        out["glucoseAverages"] = _to_native(avgs)
+        out["glucoseAverages"] = avgs
     return _to_native(out)
 
 
@@ -75,7 +145,7 @@ def _parse_response_body(body):
         return None
     if isinstance(body, str):
         try:
-            return json.loads(body) if body else None
+            return _json_loads(body) if body else None
         except Exception:
             return body
     return body
@@ -90,21 +160,23 @@ def _format_history_item(item):
 
     request_out = _form_data_with_glucose_averages(request_data)
 
-    response_out = dict(response_data)
-    body = response_out.get("body")
-    if body is not None:
-        response_out["body"] = _parse_response_body(body)
-    response_out = _to_native(response_out)
+    # Copy only when the body has to be parsed from a JSON string; _to_native itself copies only if needed
+    body = response_data.get("body")
+    if body is not None and not isinstance(body, dict):
+        response_data = dict(response_data)
+        response_data["body"] = _parse_response_body(body)
+    response_out = _to_native(response_data)
 
     ts_for_id = _truncate_timestamp_for_id(timestamp)
     item_id = f"{user_id}_{ts_for_id}"
 
-    return _to_native({
+    # request_out / response_out are already native; keys are strings
+    return {
         "id": item_id,
         "timestamp": timestamp,
         "request": request_out,
         "response": response_out,
-    })
+    }
 
 
 def _get_user_id(event):
@@ -128,7 +200,7 @@ def _get_user_id(event):
     body = event.get("body")  # GET has no body; avoid using event as body fallback
     if isinstance(body, str):
         try:
-            body = json.loads(body) if body else {}
+            body = _json_loads(body) if body else {}
         except Exception:
             body = {}
     if isinstance(body, dict):
@@ -147,34 +219,36 @@ def handler(event, context):
     try:
         http_method = (event.get("requestContext") or {}).get("http", {}).get("method") or event.get("httpMethod") or "GET"
         has_authorizer = bool((event.get("requestContext") or {}).get("authorizer"))
-        print(f"[get_history] method={http_method} has_authorizer={has_authorizer}", flush=True)
+        _log(f"method={http_method} has_authorizer={has_authorizer}")
 
         user_id = _get_user_id(event)
-        print(f"[get_history] userID={user_id}", flush=True)
+        _log(f"userID={user_id}")
         if not user_id:
             out = _response(400, {"error": "Missing userID or userId"})
-            print("[get_history] returning 400 (no userID)", flush=True)
+            _log("returning 400 (no userID)")
             return out
 
         table_name = os.environ.get("TABLE_NAME", "T2D")
         if not boto3:
             return _response(500, {"error": "boto3 not available (install in Lambda runtime)"})
 
-        dynamodb = boto3.resource("dynamodb")
-        table = dynamodb.Table(table_name)
+        table = _table(table_name)
 
         result = table.query(
             KeyConditionExpression="userID = :uid",
             ExpressionAttributeValues={":uid": str(user_id)},
             ScanIndexForward=False,
             Limit=15,
+            # Only what _format_history_item reads; skips conversation, kbCache, feedback, etc. on the same item
+            ProjectionExpression="userID, #ts, #req, #resp",
+            ExpressionAttributeNames={"#ts": "timestamp", "#req": "request", "#resp": "response"},
         )
 
         raw_items = result.get("Items", [])
         history = [_format_history_item(it) for it in raw_items]
-        print(f"[get_history] returning {len(history)} items for userID={user_id}", flush=True)
+        _log(f"returning {len(history)} items for userID={user_id}")
         out = _response(200, {"history": history})
-        print("[get_history] response built, returning 200", flush=True)
+        _log("response built, returning 200")
         return out
     except json.JSONDecodeError as e:
         return _response(400, {"error": f"Invalid JSON: {e!s}"})
@@ -193,18 +267,19 @@ def handler(event, context):
             pass
 
 
+# Shared across responses (API Gateway does not mutate it)
+_RESPONSE_HEADERS = {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"}
+
+
 def _response(status_code, body):
     """Return API Gateway Lambda proxy response. Ensures body is always a JSON string."""
     try:
-        body_str = json.dumps(body, default=str)
+        body_str = _json_dumps(body)
     except Exception as e:
-        body_str = json.dumps({"error": "Response serialization failed", "detail": str(e)})
+        body_str = _json_dumps({"error": "Response serialization failed", "detail": str(e)})
         status_code = 500
     return {
         "statusCode": status_code,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-        },
+        "headers": _RESPONSE_HEADERS,
         "body": body_str,
     }
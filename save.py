@@ -19,29 +19,97 @@ import json
 import os
 from decimal import Decimal
 from datetime import datetime
-from zoneinfo import ZoneInfo
 
 # Match ClinicalCalcs: store timestamps in Eastern (America/New_York), e.g. 2026-02-19T23:28:42.692526-05:00.
 # Frontend sends this same format for feedback lookup; history returns it as stored.
-EASTERN = ZoneInfo("America/New_York")
+# Only needed when the caller sends no timestamp, so zoneinfo is imported and the zone loaded lazily.
+_EASTERN = None
+
+
+def _eastern():
+    global _EASTERN
+    if _EASTERN is None:
+        from zoneinfo import ZoneInfo
+        _EASTERN = ZoneInfo("America/New_York")
+    return _EASTERN
 
 try:
     import boto3
 except ImportError:
     boto3 = None
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson when packaged, else stdlib; orjson.JSONDecodeError subclasses json.JSONDecodeError
+if orjson is not None:
+    def _json_loads(s):
+        return orjson.loads(s)
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj, default=str).decode("utf-8")
+else:
+    def _json_loads(s):
+        return json.loads(s)
+
+    def _json_dumps(obj):
+        return json.dumps(obj, default=str)
+
+
+_DDB = None
+_TABLES = {}
+
+
+def _table(table_name):
+    """DynamoDB Table handle, cached per name across warm invocations."""
+    global _DDB
+    if table_name not in _TABLES:
+        if _DDB is None:
+            _DDB = boto3.resource("dynamodb")
+        _TABLES[table_name] = _DDB.Table(table_name)
+    return _TABLES[table_name]
+
+
+def _has_type(obj, t):
+    """True if obj or any value nested in its dicts/lists is an instance of t (iterative, no allocation beyond the stack)."""
+    stack = [obj]
+    while stack:
+        x = stack.pop()
+        if isinstance(x, t):
+            return True
+        if isinstance(x, dict):
+            stack.extend(x.values())
+        elif isinstance(x, list):
+            stack.extend(x)
+    return False
+
 
 def _to_dynamodb(obj):
-    """Convert floats to Decimal for DynamoDB compatibility."""
-    if obj is None:
-        return None
-    if isinstance(obj, float):
-        return Decimal(str(obj))
-    if isinstance(obj, dict):
-        return {k: _to_dynamodb(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [_to_dynamodb(v) for v in obj]
-    return obj
+    """Convert floats to Decimal for DynamoDB compatibility. Returns obj unchanged when it holds no floats (common case)."""
+    if not _has_type(obj, float):
+        return obj
+    return _to_dynamodb_walk(obj)
+
+
+def _to_dynamodb_walk(obj):
+    """Iterative (explicit stack of (node, parent, key)) so deep/large payloads cost no Python frame per node."""
+    out = [None]
+    stack = [(obj, out, 0)]
+    while stack:
+        node, parent, key = stack.pop()
+        if isinstance(node, float):
+            parent[key] = Decimal(str(node))
+        elif isinstance(node, dict):
+            new = parent[key] = dict.fromkeys(node)  # keys placed now so order is preserved
+            stack.extend((v, new, k) for k, v in node.items())
+        elif isinstance(node, list):
+            new = parent[key] = [None] * len(node)
+            stack.extend((v, new, i) for i, v in enumerate(node))
+        else:
+            parent[key] = node
+    return out[0]
 
 
 def _parse_event(event):
@@ -49,7 +117,7 @@ def _parse_event(event):
     body = event.get("body", event)
     if isinstance(body, str):
         try:
-            return json.loads(body) if body else {}
+            return _json_loads(body) if body else {}
         except json.JSONDecodeError:
             return {}
     if isinstance(body, dict):
@@ -57,7 +125,7 @@ def _parse_event(event):
     return {}
 
 
-def _get_user_id(event):
+def _get_user_id(event, parsed_body=None):
     """Get userID: prefer Cognito JWT claims (requestContext.authorizer.claims.sub), else body."""
     try:
         claims = (event.get("requestContext") or {}).get("authorizer") or {}
@@ -70,84 +138,119 @@ def _get_user_id(event):
             return str(sub)
     except Exception:
         pass
-    data = _parse_event(event)
+    data = parsed_body if parsed_body is not None else _parse_event(event)
     return data.get("userID") or data.get("userId")
 
 
+def _build_item(user_id, data):
+    """Build the DynamoDB item for one { request, response [, timestamp, recommendationTimestamp, patientSummary] } record.
+    Returns (item, None) or (None, error message)."""
+    request_payload = data.get("request")
+    response_payload = data.get("response")
+    if request_payload is None or response_payload is None:
+        return None, "Missing request or response"
+
+    # Normalize response: invoker may send { statusCode, body: {...}, requestId } or the body object directly.
+    # Ensure we store the full response with body containing assessment, futureConsiderations, etc.
+    if isinstance(response_payload, dict) and "body" not in response_payload:
+        # Response was sent as the body object directly (assessment, futureConsiderations, ...)
+        response_payload = {"statusCode": 200, "body": response_payload}
+
+    # Timestamp format: Eastern, same as ClinicalCalcs (e.g. 2026-02-19T23:28:42.692526-05:00). Pass through as-is for feedback/history match.
+    response_body = response_payload.get("body") if isinstance(response_payload, dict) else {}
+    ts_from_payload = data.get("timestamp")
+    rec_ts_from_body = response_body.get("recommendationTimestamp") if isinstance(response_body, dict) else None
+    timestamp = ts_from_payload if ts_from_payload is not None and str(ts_from_payload).strip() else datetime.now(_eastern()).isoformat()
+    recommendation_timestamp = (
+        data.get("recommendationTimestamp")
+        or rec_ts_from_body
+        or timestamp
+    )
+    if isinstance(timestamp, str):
+        timestamp = timestamp.strip()
+    if isinstance(recommendation_timestamp, str):
+        recommendation_timestamp = recommendation_timestamp.strip()
+
+    # DynamoDB requires Decimal for numbers, not float. Store full request and full response (no trimming).
+    item = {
+        "userID": str(user_id),
+        "timestamp": timestamp,
+        "recommendationTimestamp": recommendation_timestamp,
+        "request": _to_dynamodb(request_payload),
+        "response": _to_dynamodb(response_payload),
+    }
+
+    # Optional fields if provided (TTL not set for now). feedback is written by feedback.py.
+    if data.get("patientSummary") is not None:
+        item["patientSummary"] = str(data["patientSummary"])
+
+    # Log keys we're storing (for debugging missing fields e.g. futureConsiderations)
+    body_keys = list(response_body.keys()) if isinstance(response_body, dict) else []
+    print(f"[save_history] saved userID={user_id} timestamp={timestamp} response.body keys={body_keys}")
+    return item, None
+
+
 def handler(event, context):
     """
     Saves request + response to DynamoDB.
     userID: from Cognito JWT (requestContext.authorizer.claims.sub) when invoked via API Gateway,
             else from body (when invoked by clinical Lambda).
-    Returns 200 { saved: true, userID, timestamp } or error.
+    Body is either one record { request, response, ... } or { items: [ { request, response, ... }, ... ] }
+    (batch: written with BatchWriteItem, 25 puts per request).
+    Returns 200 { saved: true, userID, timestamp } (batch: { saved: true, userID, timestamps, count }) or error;
+    a batch that repeats a timestamp is rejected with 400 before anything is written.
     """
     try:
         data = _parse_event(event)
-        user_id = _get_user_id(event)
+        user_id = _get_user_id(event, data)
         if not user_id:
             return _response(400, {"error": "Missing userID or userId"})
 
-        request_payload = data.get("request")
-        response_payload = data.get("response")
-        if request_payload is None or response_payload is None:
+        records = data.get("items")
+        is_batch = isinstance(records, list)
+        if not is_batch:
+            records = [data]
+        if not records:
             return _response(400, {"error": "Missing request or response"})
 
-        # Normalize response: invoker may send { statusCode, body: {...}, requestId } or the body object directly.
-        # Ensure we store the full response with body containing assessment, futureConsiderations, etc.
-        if isinstance(response_payload, dict) and "body" not in response_payload:
-            # Response was sent as the body object directly (assessment, futureConsiderations, ...)
-            response_payload = {"statusCode": 200, "body": response_payload}
+        items = []
+        for record in records:
+            item, error = _build_item(user_id, record if isinstance(record, dict) else {})
+            if error:
+                return _response(400, {"error": error})
+            items.append(item)
+        timestamps = [it["timestamp"] for it in items]
+        # One userID per call, so timestamp is the whole key; BatchWriteItem would reject a repeat and
+        # overwriting it would report records that were never stored
+        if len(set(timestamps)) != len(timestamps):
+            return _response(400, {"error": "Duplicate timestamp in items"})
 
         table_name = os.environ.get("TABLE_NAME", "T2D")
         if not boto3:
             return _response(500, {"error": "boto3 not available"})
 
-        # Timestamp format: Eastern, same as ClinicalCalcs (e.g. 2026-02-19T23:28:42.692526-05:00). Pass through as-is for feedback/history match.
-        response_body = response_payload.get("body") if isinstance(response_payload, dict) else {}
-        ts_from_payload = data.get("timestamp")
-        rec_ts_from_body = response_body.get("recommendationTimestamp") if isinstance(response_body, dict) else None
-        timestamp = ts_from_payload if ts_from_payload is not None and str(ts_from_payload).strip() else datetime.now(EASTERN).isoformat()
-        recommendation_timestamp = (
-            data.get("recommendationTimestamp")
-            or rec_ts_from_body
-            or timestamp
-        )
-        if isinstance(timestamp, str):
-            timestamp = timestamp.strip()
-        if isinstance(recommendation_timestamp, str):
-            recommendation_timestamp = recommendation_timestamp.strip()
-
-        # DynamoDB requires Decimal for numbers, not float. Store full request and full response (no trimming).
-        item = {
-            "userID": str(user_id),
-            "timestamp": timestamp,
-            "recommendationTimestamp": recommendation_timestamp,
-            "request": _to_dynamodb(request_payload),
-            "response": _to_dynamodb(response_payload),
-        }
-
-        # Optional fields if provided (TTL not set for now). feedback is written by feedback.py.
-        if data.get("patientSummary") is not None:
-            item["patientSummary"] = str(data["patientSummary"])
-
-        # Log keys we're storing (for debugging missing fields e.g. futureConsiderations)
-        response_body = response_payload.get("body") if isinstance(response_payload, dict) else {}
-        body_keys = list(response_body.keys()) if isinstance(response_body, dict) else []
-        print(f"[save_history] saved userID={user_id} timestamp={timestamp} response.body keys={body_keys}")
-
-        dynamodb = boto3.resource("dynamodb")
-        table = dynamodb.Table(table_name)
-        table.put_item(Item=item)
-
-        return _response(200, {"saved": True, "userID": str(user_id), "timestamp": timestamp})
+        table = _table(table_name)
+        if not is_batch:
+            table.put_item(Item=items[0])
+            return _response(200, {"saved": True, "userID": str(user_id), "timestamp": items[0]["timestamp"]})
+
+        # batch_writer chunks into 25-item BatchWriteItem calls and retries UnprocessedItems
+        with table.batch_writer() as batch:
+            for item in items:
+                batch.put_item(Item=item)
+        return _response(200, {"saved": True, "userID": str(user_id), "timestamps": timestamps, "count": len(items)})
     except Exception as e:
         print(f"[save_history] error: {e}")
         return _response(500, {"error": str(e)})
 
 
+# Shared across responses (API Gateway does not mutate it)
+_RESPONSE_HEADERS = {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"}
+
+
 def _response(status_code, body):
     return {
         "statusCode": status_code,
-        "headers": {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
-        "body": json.dumps(body, default=str),
+        "headers": _RESPONSE_HEADERS,
+        "body": _json_dumps(body),
     }
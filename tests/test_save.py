@@ -0,0 +1,70 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import save  # noqa: E402
+
+
+class _FakeBatch:
+    def __init__(self, table):
+        self.table = table
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def put_item(self, Item):
+        self.table.written.append(Item)
+
+
+class _FakeTable:
+    def __init__(self):
+        self.written = []
+
+    def put_item(self, Item):
+        self.written.append(Item)
+
+    def batch_writer(self, **kwargs):
+        return _FakeBatch(self)
+
+
+def _event(body):
+    return {"body": json.dumps(body), "requestContext": {"authorizer": {"claims": {"sub": "user-1"}}}}
+
+
+def _record(ts):
+    return {"request": {"patientInfo": {}}, "response": {"body": {"assessment": "A"}}, "timestamp": ts}
+
+
+class SaveBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.table = _FakeTable()
+        self._orig = save.boto3, save._table
+        save.boto3 = object()
+        save._table = lambda name: self.table
+
+    def tearDown(self):
+        save.boto3, save._table = self._orig
+
+    def test_batch_reports_every_saved_record(self):
+        resp = save.handler(_event({"items": [_record("T1"), _record("T2")]}), None)
+        self.assertEqual(resp["statusCode"], 200)
+        body = json.loads(resp["body"])
+        self.assertEqual(body["count"], 2)
+        self.assertEqual(body["timestamps"], ["T1", "T2"])
+        self.assertEqual([it["timestamp"] for it in self.table.written], ["T1", "T2"])
+
+    def test_batch_with_duplicate_timestamp_is_rejected_before_writing(self):
+        resp = save.handler(_event({"items": [_record("T1"), _record("T2"), _record("T1")]}), None)
+        self.assertEqual(resp["statusCode"], 400)
+        self.assertIn("Duplicate", json.loads(resp["body"])["error"])
+        self.assertEqual(self.table.written, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
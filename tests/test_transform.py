@@ -0,0 +1,46 @@
+import json
+import os
+import sys
+import unittest
+
+CALCS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ClinicalCalcs")
+sys.path.insert(0, CALCS_DIR)
+
+from transform import transform_request_to_patient  # noqa: E402
+
+
+def _load(name):
+    with open(os.path.join(CALCS_DIR, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+class CurrentMedicationResolutionTest(unittest.TestCase):
+    """Current medications resolve to the shipped config drug_id regardless of letter case."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.drug_classes = _load("drug_classes.json")
+        cls.goal2 = _load("dosing_config.json")
+
+    def _drug_ids(self, drug_class, drug_name):
+        request = {"currentMedications": [{"drugClass": drug_class, "drugName": drug_name}]}
+        patient = transform_request_to_patient(request, self.drug_classes, self.goal2)
+        return patient["current_drug_ids"]
+
+    def test_brand_case_variants_resolve_to_same_drug(self):
+        cases = {
+            "Semaglutide": ("Semaglutide (Ozempic)", "Semaglutide (ozempic)", "semaglutide (ozempic)", "SEMAGLUTIDE (OZEMPIC)"),
+            "Semaglutide Oral": ("Semaglutide (Rybelsus)", "Semaglutide (rybelsus)", "semaglutide (RYBELSUS)"),
+        }
+        for expected, names in cases.items():
+            for name in names:
+                with self.subTest(name=name):
+                    self.assertEqual(self._drug_ids("glp1_gip", name), {expected})
+
+    def test_brand_alone_is_case_insensitive(self):
+        self.assertEqual(self._drug_ids("sglt2", "Jardiance"), {"Empagliflozin"})
+        self.assertEqual(self._drug_ids("sglt2", "jardiance"), {"Empagliflozin"})
+
+
+if __name__ == "__main__":
+    unittest.main()